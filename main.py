@@ -6,23 +6,34 @@ import hmac
 import hashlib
 import tempfile
 import time
-from typing import Dict, Optional
-from aiohttp import web, ClientSession
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, F
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
-    LabeledPrice, PreCheckoutQuery, ContentType, BufferedInputFile, Update,
-    InaccessibleMessage
+    LabeledPrice, PreCheckoutQuery, ContentType, FSInputFile, Update,
+    InaccessibleMessage, ErrorEvent
 )
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendInvoice
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.utils.callback_answer import CallbackAnswer, CallbackAnswerMiddleware
 import aiofiles
+import aiofiles.os
+import msgspec
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -39,16 +50,125 @@ elif os.getenv("KIE_AI_API_KEY") and not os.getenv("BRS_AI_API_KEY"):
 PAYMENT_PROVIDER_TOKEN = os.getenv("PAYMENT_PROVIDER_TOKEN", "your_payment_provider_token")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://your-repl-url.replit.dev")
 CALLBACK_SECRET = os.getenv("CALLBACK_SECRET", "your_callback_secret_key_here")  # New security key
+# Secret Telegram echoes back in X-Telegram-Bot-Api-Secret-Token on every webhook POST
+# (allowed chars: A-Z, a-z, 0-9, _ and -), derived from CALLBACK_SECRET if not set explicitly
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or hashlib.sha256(
+    f"telegram:{CALLBACK_SECRET}".encode('utf-8')
+).hexdigest()
+TELEGRAM_WEBHOOK_SECRET_BYTES = TELEGRAM_WEBHOOK_SECRET.encode('utf-8')  # compare_digest only takes ASCII str
+# Concurrent webhook POSTs Telegram may open to us (Telegram's default is 40, max 100);
+# updates are acked immediately, so more connections just means less queueing at Telegram
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+
+# Optional Redis for FSM state (prompt in progress), so it survives restarts and redeploys
+REDIS_URL = os.getenv("REDIS_URL")
+FSM_STATE_TTL = 24 * 60 * 60  # Abandoned /generate flows expire from Redis after a day
 
 # Admin Configuration - Restricted Access
 ADMIN_USER_ID = 2146010529  # @niftysolsol only
 
+# Telegram outbound limits: ~30 messages/sec per bot, ~1/sec per private chat, 20/min per group
+GLOBAL_SEND_INTERVAL = 1 / 30
+PRIVATE_CHAT_SEND_INTERVAL = 1.0
+GROUP_CHAT_SEND_INTERVAL = 3.0
+# Short bursts are tolerated, so a handler's first few replies go out without waiting
+GLOBAL_SEND_BURST = 10
+CHAT_SEND_BURST = 3
+MAX_TRACKED_CHATS = 10000
+
+class SendRateLimiter(BaseRequestMiddleware):
+    """
+    Pace outgoing send* calls so the bot stays under Telegram's flood limits.
+    A token bucket per chat and one for the whole bot (kept as GCRA theoretical
+    arrival times) let a small burst through immediately, then space calls at the
+    sustained rate by sleeping, instead of hitting a 429 and stalling in aiogram's retry.
+    """
+    
+    def __init__(self):
+        self._global_tat = 0.0
+        self._chat_tat: Dict[int, float] = {}
+    
+    def _reserve_slot(self, chat_id: Optional[int]) -> float:
+        """Reserve a send slot and return how long the caller must wait for it"""
+        now = time.monotonic()
+        global_tat = max(now, self._global_tat)
+        send_at = max(now, global_tat - (GLOBAL_SEND_BURST - 1) * GLOBAL_SEND_INTERVAL)
+        
+        if isinstance(chat_id, int):
+            if len(self._chat_tat) > MAX_TRACKED_CHATS:
+                # Forget chats whose bucket has fully refilled
+                self._chat_tat = {cid: t for cid, t in self._chat_tat.items() if t > now}
+            interval = GROUP_CHAT_SEND_INTERVAL if chat_id < 0 else PRIVATE_CHAT_SEND_INTERVAL
+            chat_tat = max(now, self._chat_tat.get(chat_id, 0.0))
+            send_at = max(send_at, chat_tat - (CHAT_SEND_BURST - 1) * interval)
+            self._chat_tat[chat_id] = max(chat_tat, send_at) + interval
+        
+        # The global token is charged now rather than at send_at, so one chat waiting out
+        # its own limit doesn't push back every other chat's messages
+        self._global_tat = global_tat + GLOBAL_SEND_INTERVAL
+        return send_at - now
+    
+    async def __call__(self, make_request, bot, method):
+        if method.__api_method__.startswith("send"):
+            delay = self._reserve_slot(getattr(method, "chat_id", None))
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return await make_request(bot, method)
+
+def create_fsm_storage() -> BaseStorage:
+    """Use Redis-backed FSM storage when REDIS_URL is set, in-memory otherwise"""
+    if REDIS_URL:
+        # Imported lazily: the redis package is only needed for this deployment mode
+        from aiogram.fsm.storage.redis import RedisStorage
+        logger.info("Using Redis FSM storage")
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_STATE_TTL, data_ttl=FSM_STATE_TTL)
+    return MemoryStorage()
+
+# Connections in aiogram's own pool to api.telegram.org (aiogram defaults to 100). Video
+# uploads hold a connection for their whole transfer, so leave room for replies beside them
+TELEGRAM_CONNECTION_LIMIT = 200
+
 # Initialize Bot and Dispatcher
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(token=BOT_TOKEN, session=AiohttpSession(limit=TELEGRAM_CONNECTION_LIMIT))
+bot.session.middleware(SendRateLimiter())
+dp = Dispatcher(storage=create_fsm_storage())
+
+# Every callback query is answered once, after its handler, by this middleware.
+# Handlers customise the toast through their callback_answer argument instead of
+# calling callback.answer() themselves. Answers aren't cached by default, so a retry
+# after an error always reaches the bot; only the static help pages opt in to
+# CALLBACK_ANSWER_CACHE_TIME, during which clients reuse the answer.
+CALLBACK_ANSWER_CACHE_TIME = 5  # seconds
+dp.callback_query.middleware(CallbackAnswerMiddleware(cache_time=0))
+
+@dp.errors()
+async def handle_unexpected_error(event: ErrorEvent):
+    """Last-resort handler for exceptions that escape a handler's own error handling"""
+    logger.error(
+        f"Unhandled error for update {event.update.update_id}: {type(event.exception).__name__}: {event.exception}",
+        exc_info=event.exception
+    )
+    # Callback queries were already answered by CallbackAnswerMiddleware; a message
+    # still deserves a reply instead of silence
+    if event.update.message:
+        try:
+            await event.update.message.answer("❌ An error occurred. Please try again later.")
+        except Exception as e:
+            logger.error(f"Could not report error to user: {e}")
+    return True
 
 # Global HTTP client session
 http_session: Optional[ClientSession] = None
+HTTP_TIMEOUT = ClientTimeout(total=60, connect=10)
+VIDEO_CHUNK_SIZE = 64 * 1024  # Read size when streaming videos to disk
+SMALL_DOWNLOAD_LIMIT = 4 * 1024 * 1024  # Downloads up to this size are written in one go
+VIDEO_DOWNLOAD_TIMEOUT = ClientTimeout(total=600, sock_read=60)  # Large files, but no silent stalls
+MAX_CONCURRENT_VIDEO_DELIVERIES = 8
+video_delivery_semaphore = asyncio.Semaphore(MAX_CONCURRENT_VIDEO_DELIVERIES)
+# A burst of /generate requests queues here instead of tripping BRS AI rate limits,
+# which would fail the generations and refund them
+MAX_CONCURRENT_BRS_REQUESTS = 16
+brs_request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_BRS_REQUESTS)
 
 # Persistent storage files
 CREDITS_FILE = "user_credits.json"
@@ -56,9 +176,53 @@ GENERATIONS_FILE = "pending_generations.json"
 MODELS_FILE = "user_models.json"
 CLEANUP_FILE = "message_cleanup.json"
 
+# Temporary files: videos go straight to the temp dir, uploaded images get their own
+# subdirectory so serving and expiry only ever look at bot-created files
+TEMP_DIR = tempfile.gettempdir()
+IMAGE_DIR = os.path.join(TEMP_DIR, "videoforge_images")
+os.makedirs(IMAGE_DIR, exist_ok=True)
+IMAGE_TTL = 24 * 60 * 60  # Uploaded images are deleted after 24 hours
+IMAGE_SWEEP_INTERVAL = 60 * 60  # seconds
+
+# Extensions serve_image will hand out, and the Content-Type sent for each
+IMAGE_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+# Pending generations older than this are considered abandoned
+PENDING_GENERATION_TTL = 24 * 60 * 60  # 24 hours
+PENDING_SWEEP_INTERVAL = 10 * 60  # seconds
+MAX_PENDING_GENERATIONS = 10000  # Oldest entries are evicted beyond this
+
+@dataclass(slots=True)
+class PendingGeneration:
+    """A submitted generation waiting for its BRS AI callback"""
+    user_id: int
+    chat_id: int  # Original chat for video delivery
+    account_id: int  # Account that was charged
+    model: str
+    prompt: str
+    image_path: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "PendingGeneration":
+        """Build from a persisted record, tolerating older record layouts"""
+        known = {f.name for f in fields(cls)}
+        values = {k: v for k, v in data.items() if k in known}
+        values.setdefault("chat_id", data["user_id"])
+        values.setdefault("account_id", data["user_id"])
+        return cls(**values)
+
 # In-memory caches (loaded from persistent storage)
 user_models: Dict[int, str] = {}  # Store selected model per user
-pending_generations: Dict[str, dict] = {}  # Track pending generations
+pending_generations: Dict[str, PendingGeneration] = {}  # Track pending generations
+pending_by_user: Dict[int, int] = {}  # Pending generation count per user, kept in step with pending_generations
+claimed_generations: Set[str] = set()  # Generations whose callback is being processed; they stay persisted until done
 message_cleanup: Dict[str, dict] = {}  # Track messages to cleanup after generation
 
 def get_credit_account_id(message: Message) -> int:
@@ -80,10 +244,9 @@ def get_callback_account_id(callback: CallbackQuery) -> int:
     """Get account ID for callback based on message source"""
     if callback.message and callback.message.chat.type in ['group', 'supergroup']:
         return callback.message.chat.id  # Group ID (negative)
-    elif callback.from_user:
-        return callback.from_user.id  # User ID (positive)
-    else:
-        return 0
+    return callback.from_user.id  # User ID (positive)
+
+credits_decoder = msgspec.json.Decoder(Dict[int, int])
 
 def load_user_credits() -> Dict[int, int]:
     """
@@ -91,46 +254,209 @@ def load_user_credits() -> Dict[int, int]:
     Supports both user credits (positive IDs) and group credits (negative IDs)
     """
     try:
-        if os.path.exists(CREDITS_FILE):
-            with open(CREDITS_FILE, 'r') as f:
-                # JSON keys are strings, convert back to int
-                data = json.load(f)
-                return {int(k): v for k, v in data.items()}
+        with open(CREDITS_FILE, 'rb') as f:
+            # JSON keys are strings; the typed decoder converts them back to int
+            return credits_decoder.decode(f.read())
+    except FileNotFoundError:
         return {}
     except Exception as e:
         logger.error(f"Error loading credits: {e}")
         return {}
 
+# Credit changes are coalesced: the hot path only flags them and credits_flusher
+# writes the whole file at most once per CREDITS_FLUSH_DELAY
+CREDITS_FLUSH_DELAY = 1.0  # seconds
+credits_dirty = asyncio.Event()
+credits_write_lock = asyncio.Lock()
+credits_flusher_task: Optional[asyncio.Task] = None
+
 def save_user_credits():
     """
-    Save credits to persistent storage.
+    Mark credits as changed so the background flusher persists them.
     Supports both user credits (positive IDs) and group credits (negative IDs)
     """
+    credits_dirty.set()
+
+async def write_user_credits():
+    """Write credits to persistent storage via a temp file and atomic rename"""
+    async with credits_write_lock:
+        # Snapshot before the first await so the file never mixes two states
+        credits_dirty.clear()
+        data = msgspec.json.encode(user_credits)
+        tmp_path = CREDITS_FILE + ".tmp"
+        try:
+            await asyncio.to_thread(write_bytes_to_file, tmp_path, data)
+            os.replace(tmp_path, CREDITS_FILE)
+            logger.info("Credits saved to persistent storage")
+        except Exception as e:
+            logger.error(f"Error saving credits: {e}")
+            credits_dirty.set()  # Retry on the next flush
+
+async def credits_flusher():
+    """Persist credits shortly after they change, batching bursts of updates"""
+    while True:
+        await credits_dirty.wait()
+        await asyncio.sleep(CREDITS_FLUSH_DELAY)
+        await write_user_credits()
+
+def start_credits_flusher():
+    """Start the background credits writer"""
+    global credits_flusher_task
+    if credits_flusher_task is None or credits_flusher_task.done():
+        credits_flusher_task = asyncio.create_task(credits_flusher(), name="credits_flusher")
+
+async def stop_credits_flusher(app):
+    """Stop the background credits writer and flush any unsaved changes"""
+    global credits_flusher_task
+    if credits_flusher_task:
+        # Cancel only between writes: a write cut short would already have cleared
+        # credits_dirty, and the final flush below would then be skipped
+        async with credits_write_lock:
+            credits_flusher_task.cancel()
+        try:
+            await credits_flusher_task
+        except asyncio.CancelledError:
+            pass
+        credits_flusher_task = None
+    if credits_dirty.is_set():
+        await write_user_credits()
+
+def load_pending_generations() -> Dict[str, PendingGeneration]:
+    """Load pending generations from persistent storage, dropping expired entries"""
     try:
-        with open(CREDITS_FILE, 'w') as f:
-            json.dump(user_credits, f, indent=2)
-        logger.info("Credits saved to persistent storage")
+        with open(GENERATIONS_FILE, 'rb') as f:
+            data = msgspec.json.decode(f.read())
+    except FileNotFoundError:
+        return {}
     except Exception as e:
-        logger.error(f"Error saving credits: {e}")
-
-def load_pending_generations() -> Dict[str, dict]:
-    """Load pending generations from persistent storage"""
+        logger.error(f"Error loading pending generations: {e}")
+        return {}
+    
     try:
-        if os.path.exists(GENERATIONS_FILE):
-            with open(GENERATIONS_FILE, 'r') as f:
-                return json.load(f)
+        # Generations whose callback never arrived would otherwise live forever
+        now = time.time()
+        fresh = {
+            task_id: PendingGeneration.from_dict(gen) for task_id, gen in data.items()
+            if now - gen.get("timestamp", now) < PENDING_GENERATION_TTL
+        }
+        if len(fresh) != len(data):
+            logger.info(f"Dropped {len(data) - len(fresh)} expired pending generations")
+        return fresh
     except Exception as e:
         logger.error(f"Error loading pending generations: {e}")
-    return {}
+        return {}
+
+# Pending-table changes are coalesced like credits: add/remove only flag them and
+# pending_flusher writes the whole table at most once per PENDING_FLUSH_DELAY
+PENDING_FLUSH_DELAY = 1.0  # seconds
+pending_dirty = asyncio.Event()
+pending_write_lock = asyncio.Lock()
+pending_flusher_task: Optional[asyncio.Task] = None
 
 def save_pending_generations():
-    """Save pending generations to persistent storage"""
-    try:
-        with open(GENERATIONS_FILE, 'w') as f:
-            json.dump(pending_generations, f, indent=2)
-        logger.info("Pending generations saved to persistent storage")
-    except Exception as e:
-        logger.error(f"Error saving pending generations: {e}")
+    """Mark the pending table as changed so the background flusher persists it"""
+    pending_dirty.set()
+
+async def write_pending_generations():
+    """Write pending generations to persistent storage via a temp file and atomic rename"""
+    async with pending_write_lock:
+        # Snapshot before the first await so the file never mixes two states
+        pending_dirty.clear()
+        data = msgspec.json.encode(pending_generations)
+        tmp_path = GENERATIONS_FILE + ".tmp"
+        try:
+            await asyncio.to_thread(write_bytes_to_file, tmp_path, data)
+            os.replace(tmp_path, GENERATIONS_FILE)
+            logger.info("Pending generations saved to persistent storage")
+        except Exception as e:
+            logger.error(f"Error saving pending generations: {e}")
+            pending_dirty.set()  # Retry on the next flush
+
+async def pending_flusher():
+    """Persist the pending table shortly after it changes, batching bursts of updates"""
+    while True:
+        await pending_dirty.wait()
+        await asyncio.sleep(PENDING_FLUSH_DELAY)
+        await write_pending_generations()
+
+def start_pending_flusher():
+    """Start the background pending-generations writer"""
+    global pending_flusher_task
+    if pending_flusher_task is None or pending_flusher_task.done():
+        pending_flusher_task = asyncio.create_task(pending_flusher(), name="pending_flusher")
+
+async def stop_pending_flusher(app):
+    """Stop the background pending-generations writer and flush any unsaved changes"""
+    global pending_flusher_task
+    if pending_flusher_task:
+        # Cancel only between writes, as stop_credits_flusher does
+        async with pending_write_lock:
+            pending_flusher_task.cancel()
+        try:
+            await pending_flusher_task
+        except asyncio.CancelledError:
+            pass
+        pending_flusher_task = None
+    if pending_dirty.is_set():
+        await write_pending_generations()
+
+def add_pending_generation(task_id: str, generation: PendingGeneration):
+    """Register a submitted generation and persist the pending table"""
+    if task_id not in pending_generations:
+        # Dicts keep insertion order, so the first unclaimed key is the oldest submission
+        # that isn't being delivered right now
+        while len(pending_generations) >= MAX_PENDING_GENERATIONS:
+            oldest = next((task_id for task_id in pending_generations if task_id not in claimed_generations), None)
+            if oldest is None:
+                break
+            logger.warning(f"Pending generations at capacity, evicting {oldest}")
+            remove_pending_generation(oldest, save=False)
+        pending_by_user[generation.user_id] = pending_by_user.get(generation.user_id, 0) + 1
+    pending_generations[task_id] = generation
+    save_pending_generations()
+
+def remove_pending_generation(task_id: str, save: bool = True) -> Optional[PendingGeneration]:
+    """Drop a finished generation from the pending table and return it"""
+    generation = pending_generations.pop(task_id, None)
+    if generation is not None:
+        remaining = pending_by_user.get(generation.user_id, 0) - 1
+        if remaining > 0:
+            pending_by_user[generation.user_id] = remaining
+        else:
+            pending_by_user.pop(generation.user_id, None)
+        if save:
+            save_pending_generations()
+    return generation
+
+def remove_expired_pending_generations() -> int:
+    """Drop generations whose callback never arrived within PENDING_GENERATION_TTL"""
+    cutoff = time.time() - PENDING_GENERATION_TTL
+    expired = [task_id for task_id, gen in pending_generations.items()
+               if gen.timestamp < cutoff and task_id not in claimed_generations]
+    for task_id in expired:
+        remove_pending_generation(task_id, save=False)
+    if expired:
+        save_pending_generations()
+    return len(expired)
+
+async def pending_generation_sweeper():
+    """Periodically expire abandoned generations so the pending table stays bounded"""
+    while True:
+        await asyncio.sleep(PENDING_SWEEP_INTERVAL)
+        try:
+            removed = remove_expired_pending_generations()
+            if removed:
+                logger.info(f"Dropped {removed} expired pending generations")
+        except Exception as e:
+            logger.error(f"Error sweeping pending generations: {e}")
+
+pending_sweeper_task: Optional[asyncio.Task] = None
+
+def start_pending_sweeper():
+    """Start the background pending-generation expiry"""
+    global pending_sweeper_task
+    if pending_sweeper_task is None or pending_sweeper_task.done():
+        pending_sweeper_task = asyncio.create_task(pending_generation_sweeper(), name="pending_generation_sweeper")
 
 def load_user_models() -> Dict[int, str]:
     """Load user models from persistent storage"""
@@ -229,6 +555,8 @@ async def cleanup_generation_messages(generation_id: str, keep_final_message_id:
 # Load existing data on startup
 user_credits: Dict[int, int] = load_user_credits()
 pending_generations = load_pending_generations()
+for gen in pending_generations.values():
+    pending_by_user[gen.user_id] = pending_by_user.get(gen.user_id, 0) + 1
 user_models = load_user_models()
 message_cleanup = load_message_cleanup()
 logger.info(f"Loaded {len(user_credits)} user credit accounts from storage")
@@ -253,12 +581,193 @@ AVAILABLE_MODELS = {
 # Models that skip image upload (text-to-video only)
 TEXT_ONLY_MODELS = {"wan_2_2_t2v", "sora_2_t2v"}
 
+# Image-to-video models that can't run without an image (no skip button)
+IMAGE_REQUIRED_MODELS = frozenset({"wan_2_2_i2v", "wan_2_5", "hailuo", "kling_master_i2v", "runway_gen3", "sora_2_i2v"})
+
+# Welcome screen, split around the user's name and credit balance so only those
+# two values are formatted per /start
+WELCOME_TEXT_HEAD = """
+🎬 **Welcome to AI Video Generator Bot!**
+
+👋 **Hello """
+WELCOME_TEXT_CREDITS = """!**
+
+💳 **Your Credits:** """
+WELCOME_TEXT_FOOTER = """
+
+🚀 **Quick Start:**
+• Use /generate to create amazing videos
+• Need credits? Try /buy for great packages
+• Get help anytime with /help
+
+🎯 **Available Models:** 7 AI models including Veo 3, Runway Gen-3, Sora 2, and Kling 2.1
+
+💰 **Pricing:** 1 credit per video, bulk discounts available
+
+✨ Ready to create something amazing?
+"""
+WELCOME_TEXT_BETA_FOOTER = WELCOME_TEXT_FOOTER.replace(
+    "\n\n✨ Ready",
+    "\n\n⚠️ **This bot is in BETA - not everything works yet - we are updating daily!**\n\n✨ Ready"
+)
+
+def format_welcome_text(first_name: Optional[str], credits: int, footer: str = WELCOME_TEXT_FOOTER) -> str:
+    """Fill the user's name and balance into the prebuilt welcome screen"""
+    # Joining the fixed pieces with an f-string beats str.format on a full template:
+    # there is no template to scan, just four concatenations
+    return (
+        f"{WELCOME_TEXT_HEAD}{first_name or 'there'}"
+        f"{WELCOME_TEXT_CREDITS}{credits} {'credit' if credits == 1 else 'credits'}"
+        f"{footer}"
+    )
+
+# Closing part of the "generation started" message, identical for every generation
+GENERATION_STEPS_TEXT = (
+    "🎬 **Processing steps:**\n"
+    "✅ Request submitted\n"
+    "⏳ Analyzing prompt...\n"
+    "⏳ Generating video...\n"
+    "⏳ Finalizing output...\n\n"
+    "🔔 **You'll be notified when ready!**"
+)
+
+# Telegram Stars price -> package; the invoice and the payment handler both read this
+CREDIT_PACKAGES = {
+    100: {"credits": 1, "title": "Starter Package", "description": "1 credit for video generation"},
+    1000: {"credits": 12, "title": "Popular Package", "description": "12 credits for video generation"},
+    2000: {"credits": 25, "title": "Best Value Package", "description": "25 credits for video generation"},
+    5000: {"credits": 75, "title": "Premium Package", "description": "75 credits for video generation"},
+    10000: {"credits": 175, "title": "Ultimate Package", "description": "175 credits for video generation"}
+}
+
+# Invoices are identical per package except for the buyer's chat and payload, so each is
+# validated once here and copied with those two fields filled in per purchase
+INVOICE_TEMPLATES = {
+    stars: SendInvoice(
+        chat_id=0,
+        title=package["title"],
+        description=package["description"],
+        payload="",
+        provider_token="",  # Empty for Telegram Stars (XTR)
+        currency="XTR",  # Telegram Stars
+        prices=[LabeledPrice(label=f"{package['credits']} Video Credits", amount=stars)],
+        need_email=False,
+        need_phone_number=False,
+        need_name=False,
+        need_shipping_address=False,
+        is_flexible=False
+    )
+    for stars, package in CREDIT_PACKAGES.items()
+}
+
+# Fixed message bodies; only the balance is filled in per request
+CHOOSE_MODEL_TEXT = (
+    "🤖 **Choose Your AI Model**\n\n"
+    "💳 **Your Balance:** `{credits}` credits\n\n"
+    "🎯 **Select the perfect model for your video:**\n\n"
+    "⚡ **Fast:** Quick generation (1-2 min)\n"
+    "🎵 **Audio:** High quality with sound\n"
+    "🚀 **Advanced:** Premium features\n"
+    "💰 **Affordable:** Budget-friendly options\n\n"
+    "👆 **Tap a model below to continue:**"
+)
+RESET_MODEL_TEXT = (
+    "🔄 **Model Selection Reset**\n\n"
+    "💳 **Your Balance:** `{credits}` credits\n\n"
+    "🤖 **Choose Your AI Model:**\n\n"
+    "⚡ **Fast:** Quick generation (1-2 min)\n"
+    "🎵 **Audio:** High quality with sound\n"
+    "🚀 **Advanced:** Premium features\n"
+    "💰 **Affordable:** Budget-friendly options\n\n"
+    "👆 **Select a model to get started:**"
+)
+CREDIT_STORE_TEXT = (
+    "💳 **Credit Store**\n\n"
+    "💰 **Current Balance:** `{credits}` {noun}\n\n"
+    "⭐ **Telegram Stars Pricing:**\n"
+    "• 1 Credit = 100 Stars (≈ $1.30)\n"
+    "• Instant delivery\n"
+    "• Secure Telegram payment\n\n"
+    "🎬 **What you get:**\n"
+    "• Generate 1 high-quality AI video\n"
+    "• Choice of 5 premium models\n"
+    "• Image-to-video support\n"
+    "• Direct delivery to Telegram\n\n"
+    "💡 **Tip:** Credits never expire, bulk discounts available!"
+)
+INSUFFICIENT_CREDITS_TEXT = (
+    "💸 **Insufficient Credits!**\n\n"
+    "💳 **Current Balance:** `{credits}` credits\n\n"
+    "🎬 **Required:** `1` credit for video generation\n\n"
+    "💡 **Quick Solutions:**\n"
+    "• Buy credits with Telegram Stars (⭐)\n"
+    "• 100 Stars = 1 Credit (≈ $1.30)\n\n"
+    "👆 **Tap below to get started!**"
+)
+PACKAGES_TEXT = (
+    "⭐ **Credit Packages - Telegram Stars**\n\n"
+    "💳 **Current Balance:** {credits} credits\n\n"
+    "🎯 **Starter Package**\n"
+    "• 100 Stars → 1 Credit\n"
+    "• Perfect for trying out models\n\n"
+    "🔥 **Popular Choice**\n"
+    "• 1000 Stars → 12 Credits\n"
+    "• Great value for regular users\n\n"
+    "💎 **Best Value**\n"
+    "• 2000 Stars → 25 Credits\n"
+    "• More credits per star\n\n"
+    "🚀 **Premium Package**\n"
+    "• 5000 Stars → 75 Credits\n"
+    "• Excellent savings per credit\n\n"
+    "👑 **Ultimate Package**\n"
+    "• 10000 Stars → 175 Credits\n"
+    "• Maximum value for power users\n\n"
+    "✨ **All packages include:**\n"
+    "• Access to all 5 AI models\n"
+    "• Image-to-video support\n"
+    "• Instant video delivery\n"
+    "• Credits never expire\n\n"
+    "💡 Choose a package above to proceed!"
+)
+
 # FSM States
 class GenerationStates(StatesGroup):
     waiting_for_prompt = State()
     waiting_for_image = State()
 
+# BRS AI callback payload
+# {"code": 200, "msg": "success", "data": {"taskId": "...", "info": {"resultUrls": "[\"url1\"]"}}}
+# Different model families use different spellings, so both variants are decoded.
+class BrsCallbackInfo(msgspec.Struct):
+    result_urls: Union[str, List[str], None] = msgspec.field(default=None, name="resultUrls")
+    result_urls_snake: Union[str, List[str], None] = msgspec.field(default=None, name="result_urls")
+
+class BrsCallbackData(msgspec.Struct):
+    task_id: Optional[str] = msgspec.field(default=None, name="taskId")
+    task_id_snake: Optional[str] = msgspec.field(default=None, name="task_id")
+    info: Optional[BrsCallbackInfo] = None
+    video_url: Optional[str] = None  # Runway format
+    result_json: Optional[str] = msgspec.field(default=None, name="resultJson")  # Wan 2.2 format
+
+class BrsCallbackPayload(msgspec.Struct):
+    code: Optional[int] = None
+    msg: Optional[str] = ""
+    data: Optional[BrsCallbackData] = None
+
+brs_callback_decoder = msgspec.json.Decoder(BrsCallbackPayload)
+
+# Nested JSON strings inside the payload: Wan 2.2's resultJson and stringified resultUrls
+class BrsResultJson(msgspec.Struct):
+    result_urls: List[str] = msgspec.field(default_factory=list, name="resultUrls")
+
+brs_result_json_decoder = msgspec.json.Decoder(BrsResultJson)
+brs_result_urls_decoder = msgspec.json.Decoder(List[str])
+
 # Helper functions
+# Credit reads and writes only ever run on the event loop thread, and none of the
+# credit helpers below await anything, so each read-modify-write completes before
+# any other handler can observe the balance. Keep them synchronous and await-free:
+# that is what makes concurrent deductions for the same account safe without locks.
 def get_credits(account_id: int) -> int:
     """
     Get credits for account (user or group).
@@ -281,13 +790,22 @@ def add_credits(account_id: int, amount: int):
     if account_id == 0:
         logger.error("Invalid account_id: 0 - cannot add credits")
         return
-    if account_id not in user_credits:
-        user_credits[account_id] = 0
-    user_credits[account_id] += amount
+    user_credits[account_id] = user_credits.get(account_id, 0) + amount
     save_user_credits()  # Save to persistent storage
     account_type = "group" if account_id < 0 else "user"
     logger.info(f"Added {amount} credits to {account_type} {account_id}. Total: {user_credits[account_id]}")
 
+# Per-user locks serializing generation submits; entries vanish once no handler holds them
+generation_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def get_generation_lock(user_id: int) -> asyncio.Lock:
+    """Get the lock that serializes generation submits for a user"""
+    lock = generation_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        generation_locks[user_id] = lock
+    return lock
+
 def deduct_credits(account_id: int, amount: int) -> bool:
     """
     Deduct credits from account (user or group). Returns True if successful.
@@ -296,7 +814,7 @@ def deduct_credits(account_id: int, amount: int) -> bool:
     if account_id == 0:
         logger.error("Invalid account_id: 0 - cannot deduct credits")
         return False
-    current_credits = get_credits(account_id)
+    current_credits = user_credits.get(account_id, 0)
     if current_credits >= amount:
         user_credits[account_id] = current_credits - amount
         save_user_credits()  # Save to persistent storage
@@ -328,348 +846,461 @@ def create_model_selection_keyboard():
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+# AVAILABLE_MODELS never changes at runtime, so the keyboard is built once and shared
+MODEL_SELECTION_KEYBOARD = create_model_selection_keyboard()
+# Button callback data -> model key, so a selection is one lookup instead of a split
+MODEL_CALLBACKS = {f"model_{model_key}": model_key for model_key in AVAILABLE_MODELS}
+
+# Static menus shared by every handler that shows them
+WELCOME_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="💳 Buy Credits", callback_data="show_packages"),
+     InlineKeyboardButton(text="❓ Help & Guide", callback_data="help_main")],
+    [InlineKeyboardButton(text="📊 My Stats", callback_data="user_stats")]
+])
+NO_CREDITS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💳 Buy Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton(text="📚 Learn More", callback_data="help_credits")]
+])
+BUY_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⭐ Buy 1 Credit (100 Stars)", callback_data="buy_package_100")],
+    [InlineKeyboardButton(text="📊 Credit Packages", callback_data="buy_packages")],
+    [InlineKeyboardButton(text="💡 How Stars Work", callback_data="help_stars")],
+    [InlineKeyboardButton(text="🔙 Back to Menu", callback_data="back_main")]
+])
+PACKAGES_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎯 Starter: 100⭐ → 1 Credit", callback_data="buy_package_100")],
+    [InlineKeyboardButton(text="🔥 Popular: 1000⭐ → 12 Credits", callback_data="buy_package_1000")],
+    [InlineKeyboardButton(text="💎 Best Value: 2000⭐ → 25 Credits", callback_data="buy_package_2000")],
+    [InlineKeyboardButton(text="🚀 Premium: 5000⭐ → 75 Credits", callback_data="buy_package_5000")],
+    [InlineKeyboardButton(text="👑 Ultimate: 10000⭐ → 175 Credits", callback_data="buy_package_10000")],
+    [InlineKeyboardButton(text="🔙 Back to Menu", callback_data="back_to_start")]
+])
+STATS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="💳 Buy Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton(text="🔙 Main Menu", callback_data="back_main")]
+])
+# Image prompt for models that accept an image; image-required models get no skip button
+IMAGE_OPTIONAL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⏭️ Skip Image", callback_data="skip_image")],
+    [InlineKeyboardButton(text="❓ Image Tips", callback_data="help_image")]
+])
+IMAGE_REQUIRED_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="❓ Image Tips", callback_data="help_image")]
+])
+GENERATION_STARTED_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="📊 Check Status", callback_data="user_stats")],
+    [InlineKeyboardButton(text="🎬 Generate Another", callback_data="quick_generate")]
+])
+RETRY_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔄 Try Again", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="💡 Get Help", callback_data="help_troubleshoot"),
+     InlineKeyboardButton(text="💳 Check Credits", callback_data="user_stats")]
+])
+ADMIN_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💳 Give Credits", callback_data="admin_give_credits")],
+    [InlineKeyboardButton(text="📊 View All Users", callback_data="admin_view_users")],
+    [InlineKeyboardButton(text="🔍 User Lookup", callback_data="admin_user_lookup")],
+    [InlineKeyboardButton(text="📈 Bot Stats", callback_data="admin_stats")]
+])
+ADMIN_BACK_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔙 Admin Panel", callback_data="admin_back")]
+])
+
+# Encoded once; hmac.digest is a one-shot OpenSSL call with no Python-level HMAC object
+CALLBACK_SECRET_BYTES = CALLBACK_SECRET.encode('utf-8')
+CALLBACK_SIGNATURE_LENGTH = hashlib.sha256().digest_size * 2  # Hex characters
+
 def verify_callback_signature(payload: bytes, signature: str) -> bool:
     """Verify HMAC signature for callback authentication"""
-    try:
-        expected_signature = hmac.new(
-            CALLBACK_SECRET.encode('utf-8'),
-            payload,
-            hashlib.sha256
-        ).hexdigest()
-        return hmac.compare_digest(signature, expected_signature)
-    except Exception as e:
-        logger.error(f"Error verifying callback signature: {e}")
+    # The length is public, so rejecting on it leaks nothing and skips hashing the body
+    if len(signature) != CALLBACK_SIGNATURE_LENGTH:
         return False
+    try:
+        provided_signature = bytes.fromhex(signature)
+    except ValueError:
+        return False  # Not hex, can't match
+    # bytes in, bytes out: neither call can raise here
+    return hmac.compare_digest(provided_signature, hmac.digest(CALLBACK_SECRET_BYTES, payload, 'sha256'))
+
+# (chat_id, message_id) -> hash of the content we last put there, so re-pressing a
+# button that would render the same page skips the editMessageText round-trip.
+# Every menu edit must go through safe_edit_message for this to stay accurate.
+MAX_TRACKED_EDITS = 4096
+last_edit_hashes: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+
+def remember_edit(edit_key: Tuple[int, int], content_hash: int):
+    """Record what a message now shows, evicting the least recently edited entry"""
+    last_edit_hashes[edit_key] = content_hash
+    last_edit_hashes.move_to_end(edit_key)
+    if len(last_edit_hashes) > MAX_TRACKED_EDITS:
+        last_edit_hashes.popitem(last=False)
 
 async def safe_edit_message(callback: CallbackQuery, text: str, reply_markup=None, parse_mode: Optional[str] = None) -> bool:
     """
     Safely edit callback message with proper type checking.
     Returns True if message was successfully edited, False if sent as new message.
     """
-    try:
-        if callback.message and isinstance(callback.message, types.Message):
-            await callback.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    message = callback.message
+    if isinstance(message, Message):  # InaccessibleMessage can't be edited
+        edit_key = (message.chat.id, message.message_id)
+        content_hash = hash((text, parse_mode, repr(reply_markup)))
+        if last_edit_hashes.get(edit_key) == content_hash:
+            # Same page pressed again: Telegram would reject the edit anyway
+            last_edit_hashes.move_to_end(edit_key)
             return True
-        elif callback.from_user:
-            await bot.send_message(callback.from_user.id, text, reply_markup=reply_markup, parse_mode=parse_mode)
-            return False
-        else:
-            logger.warning("Unable to edit message or send new message - no user info")
-            return False
+        try:
+            await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            remember_edit(edit_key, content_hash)
+            return True
+        except TelegramBadRequest as e:
+            # Pressing the same button twice re-renders identical content; the user
+            # already sees it, so don't send a duplicate
+            if "message is not modified" in str(e):
+                remember_edit(edit_key, content_hash)
+                return True
+            logger.warning(f"Could not edit message, sending a new one: {e}")
+        except Exception as e:
+            logger.error(f"Error in safe_edit_message: {e}")
+    
+    try:
+        await bot.send_message(callback.from_user.id, text, reply_markup=reply_markup, parse_mode=parse_mode)
     except Exception as e:
-        logger.error(f"Error in safe_edit_message: {e}")
-        # Fallback: try to send as new message
-        if callback.from_user:
-            try:
-                await bot.send_message(callback.from_user.id, text, reply_markup=reply_markup, parse_mode=parse_mode)
-                return False
-            except Exception as fallback_error:
-                logger.error(f"Fallback message send also failed: {fallback_error}")
-        return False
+        logger.error(f"Fallback message send also failed: {e}")
+    return False
+
+def write_bytes_to_file(path: str, data: bytes):
+    """Write a small payload to disk in one call (run via asyncio.to_thread)"""
+    with open(path, 'wb') as f:
+        f.write(data)
 
-async def download_telegram_file(file_id: str) -> Optional[bytes]:
-    """Download file from Telegram and return its content"""
+async def download_to_temp_file(url: str, filename: str, directory: str = TEMP_DIR) -> Optional[str]:
+    """Stream a remote file to a temporary path chunk by chunk and return the path"""
+    temp_path = os.path.join(directory, filename)
     try:
-        file_info = await bot.get_file(file_id)
-        if not file_info.file_path:
-            logger.error(f"No file path for file_id: {file_id}")
-            return None
-            
-        # Download file using aiohttp
-        global http_session
-        if not http_session:
-            http_session = ClientSession()
+        async with get_http_session().get(url, timeout=VIDEO_DOWNLOAD_TIMEOUT) as response:
+            if response.status != 200:
+                logger.error(f"Failed to download {filename}: HTTP {response.status}")
+                return None
             
-        file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_info.file_path}"
-        
-        async with http_session.get(file_url) as response:
-            if response.status == 200:
-                content = await response.read()
-                logger.info(f"Successfully downloaded file {file_id}, size: {len(content)} bytes")
-                return content
+            if response.content_length is not None and response.content_length <= SMALL_DOWNLOAD_LIMIT:
+                # Typical photos: one read and a single write on a worker thread beats a
+                # thread hand-off per chunk
+                body = await response.read()
+                await asyncio.to_thread(write_bytes_to_file, temp_path, body)
             else:
-                logger.error(f"Failed to download file {file_id}: HTTP {response.status}")
-                return None
-                
+                # Write chunks as they arrive so the whole file is never held in memory
+                async with aiofiles.open(temp_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(VIDEO_CHUNK_SIZE):
+                        await f.write(chunk)
+        
+        return temp_path
+        
     except Exception as e:
-        logger.error(f"Error downloading Telegram file {file_id}: {e}")
+        logger.error(f"Error downloading {filename} to temporary file: {e}")
+        remove_temp_file(temp_path)
         return None
 
-async def upload_image_to_temporary_storage(image_content: bytes, filename: str) -> Optional[str]:
-    """Upload image to temporary storage and return accessible URL/path"""
+def remove_temp_file(path: str):
+    """Delete a temporary file, ignoring it if already gone"""
     try:
-        # Create temporary file
-        temp_dir = tempfile.gettempdir()
-        temp_path = os.path.join(temp_dir, f"telegram_image_{filename}")
-        
-        # Write image content to temporary file
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(image_content)
-        
-        logger.info(f"Image saved to temporary storage: {temp_path}")
-        return temp_path
-        
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Error removing temporary file {path}: {e}")
+
+# Telegram file_id -> (file_path, resolved_at). Download links stay valid for at least
+# an hour, so a retried upload of the same photo can skip the getFile round-trip
+TELEGRAM_FILE_PATH_TTL = 55 * 60  # seconds
+MAX_CACHED_FILE_PATHS = 1024
+telegram_file_paths: Dict[str, Tuple[str, float]] = {}
+
+async def resolve_telegram_file_path(file_id: str) -> Tuple[Optional[str], bool]:
+    """Get the download path for a Telegram file and whether it came from the cache"""
+    cached = telegram_file_paths.get(file_id)
+    if cached and time.time() - cached[1] < TELEGRAM_FILE_PATH_TTL:
+        return cached[0], True
+    
+    try:
+        file_info = await bot.get_file(file_id)
     except Exception as e:
-        logger.error(f"Error uploading image to temporary storage: {e}")
+        logger.error(f"Error getting Telegram file {file_id}: {e}")
+        return None, False
+    if not file_info.file_path:
+        logger.error(f"No file path for file_id: {file_id}")
+        return None, False
+    
+    if len(telegram_file_paths) >= MAX_CACHED_FILE_PATHS:
+        telegram_file_paths.pop(next(iter(telegram_file_paths)))  # Oldest entry
+    telegram_file_paths[file_id] = (file_info.file_path, time.time())
+    return file_info.file_path, False
+
+async def stash_telegram_file(file_id: str, filename: str) -> Optional[str]:
+    """Stream a Telegram file straight into temporary storage and return its path"""
+    file_path, was_cached = await resolve_telegram_file_path(file_id)
+    if not file_path:
         return None
+    
+    file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
+    temp_path = await download_to_temp_file(file_url, f"telegram_image_{filename}", IMAGE_DIR)
+    if not temp_path:
+        # The cached link may have expired; forget it and retry once with a fresh one
+        telegram_file_paths.pop(file_id, None)
+        if was_cached:
+            return await stash_telegram_file(file_id, filename)
+        return None
+    
+    logger.info(f"Image saved to temporary storage: {temp_path}")
+    return temp_path
+
+def remove_expired_images() -> int:
+    """Delete uploaded images older than IMAGE_TTL and return how many were removed"""
+    cutoff = time.time() - IMAGE_TTL
+    removed = 0
+    with os.scandir(IMAGE_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove expired image {entry.name}: {e}")
+    return removed
+
+async def image_sweeper():
+    """Periodically clear out uploaded images nobody fetched or cleaned up"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(remove_expired_images)
+            if removed:
+                logger.info(f"Removed {removed} expired images from {IMAGE_DIR}")
+        except Exception as e:
+            logger.error(f"Error sweeping expired images: {e}")
+        await asyncio.sleep(IMAGE_SWEEP_INTERVAL)
+
+image_sweeper_task: Optional[asyncio.Task] = None
+
+def start_image_sweeper():
+    """Start the background expired-image cleanup"""
+    global image_sweeper_task
+    if image_sweeper_task is None or image_sweeper_task.done():
+        image_sweeper_task = asyncio.create_task(image_sweeper(), name="image_sweeper")
+
+# Request pieces that are identical for every BRS AI call
+BRS_API_HEADERS = {
+    "Authorization": f"Bearer {BRS_AI_API_KEY}",
+    "Content-Type": "application/json"
+}
+BRS_CALLBACK_URL = f"{WEBHOOK_URL.rstrip('/')}/brs_callback"
+brs_request_encoder = msgspec.json.Encoder()
+
+# BRS AI (kie.ai) endpoints
+KIE_VEO_URL = "https://api.kie.ai/api/v1/veo/generate"
+KIE_RUNWAY_URL = "https://api.kie.ai/api/v1/runway/generate"
+KIE_JOBS_URL = "https://api.kie.ai/api/v1/jobs/createTask"
+IMAGE_URL_BASE = f"{WEBHOOK_URL.rstrip('/')}/images/"  # Uploaded images are served by serve_image
+
+# Request builders: (model, prompt, image_url) -> (api_url, payload), registered per
+# model key with @brs_model so adding a model is one decorator line
+BrsRequestBuilder = Callable[[str, str, Optional[str]], Tuple[str, dict]]
+BRS_REQUEST_BUILDERS: Dict[str, BrsRequestBuilder] = {}
+
+def brs_model(*model_keys: str) -> Callable[[BrsRequestBuilder], BrsRequestBuilder]:
+    """Register a request builder for one or more model keys"""
+    def register(builder: BrsRequestBuilder) -> BrsRequestBuilder:
+        for model_key in model_keys:
+            BRS_REQUEST_BUILDERS[model_key] = builder
+        return builder
+    return register
+
+def build_kie_job(model_name: str, input_data: dict) -> Tuple[str, dict]:
+    """Wrap model input in the generic createTask job payload"""
+    return KIE_JOBS_URL, {
+        "model": model_name,
+        "callBackUrl": BRS_CALLBACK_URL,
+        "input": input_data
+    }
+
+@brs_model("veo3_fast")
+def build_veo_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    """Veo 3 models take the model name as-is"""
+    data = {
+        "prompt": prompt,
+        "model": model,
+        "aspectRatio": "16:9",
+        "enableFallback": False,
+        "enableTranslation": True,
+        "callBackUrl": BRS_CALLBACK_URL
+    }
+    if image_url:
+        data["imageUrls"] = [image_url]
+    return KIE_VEO_URL, data
+
+@brs_model("veo3_1_fast")
+def build_veo3_1_fast_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    """Veo 3.1 Fast runs on veo3_fast with an explicit generation type"""
+    api_url, data = build_veo_request("veo3_fast", prompt, image_url)
+    data["generationType"] = "FIRST_AND_LAST_FRAMES_2_VIDEO" if image_url else "TEXT_2_VIDEO"
+    return api_url, data
+
+@brs_model("runway_gen3")
+def build_runway_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    data = {
+        "prompt": prompt,
+        "duration": 5,
+        "quality": "720p",
+        "aspectRatio": "16:9",
+        "model": "runway-duration-5-generate",
+        "waterMark": "",
+        "callBackUrl": BRS_CALLBACK_URL
+    }
+    if image_url:
+        data["imageUrl"] = image_url
+    return KIE_RUNWAY_URL, data
+
+@brs_model("wan_2_5")
+def build_wan_2_5_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    if not image_url:
+        raise Exception("Wan 2.5 requires an image")
+    return build_kie_job("wan/2-5-image-to-video", {
+        "prompt": prompt,
+        "duration": "5",
+        "resolution": "1080p",
+        "enable_prompt_expansion": True,
+        "image_url": image_url
+    })
+
+@brs_model("wan_2_2_t2v")
+def build_wan_2_2_t2v_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    return build_kie_job("wan/2-2-a14b-text-to-video-turbo", {
+        "prompt": prompt,
+        "resolution": "720p",
+        "aspect_ratio": "16:9",
+        "enable_prompt_expansion": False,
+        "acceleration": "none"
+    })
+
+@brs_model("wan_2_2_i2v")
+def build_wan_2_2_i2v_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    input_data = {
+        "prompt": prompt,
+        "resolution": "720p",
+        "aspect_ratio": "auto",
+        "enable_prompt_expansion": False,
+        "acceleration": "none"
+    }
+    if image_url:
+        input_data["image_url"] = image_url
+    return build_kie_job("wan/2-2-a14b-image-to-video-turbo", input_data)
+
+@brs_model("hailuo")
+def build_hailuo_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    if not image_url:
+        raise Exception("Hailuo requires an image")
+    return build_kie_job("hailuo/2-3-image-to-video-pro", {
+        "prompt": prompt,
+        "duration": "6",
+        "resolution": "768P",
+        "image_url": image_url
+    })
+
+KLING_MODEL_NAMES = {
+    "kling_standard": "kling/v2-1-standard",
+    "kling_pro": "kling/v2-1-pro",
+    "kling_master_i2v": "kling/v2-1-master-image-to-video",
+    "kling_master_t2v": "kling/v2-1-master-text-to-video"
+}
+
+@brs_model(*KLING_MODEL_NAMES)
+def build_kling_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    input_data = {
+        "prompt": prompt,
+        "duration": "5",  # 5 seconds default
+        "aspect_ratio": "16:9",
+        "negative_prompt": "blur, distort, and low quality",
+        "cfg_scale": 0.5
+    }
+    # Only the image-to-video variants take an image
+    if image_url and model != "kling_master_t2v":
+        input_data["image_url"] = image_url
+    return build_kie_job(KLING_MODEL_NAMES[model], input_data)
+
+@brs_model("sora_2_t2v")
+def build_sora_2_t2v_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    return build_kie_job("sora-2-text-to-video", {
+        "prompt": prompt,
+        "aspect_ratio": "landscape",
+        "quality": "standard"
+    })
+
+@brs_model("sora_2_i2v")
+def build_sora_2_i2v_request(model: str, prompt: str, image_url: Optional[str]) -> Tuple[str, dict]:
+    input_data = {
+        "prompt": prompt,
+        "aspect_ratio": "landscape",
+        "quality": "standard"
+    }
+    if image_url:
+        input_data["image_urls"] = [image_url]  # Sora 2 takes an array
+    return build_kie_job("sora-2-image-to-video", input_data)
+
+
+# Catch a model added to the menu without a request builder at startup, not on first use
+_models_without_builder = set(AVAILABLE_MODELS) - BRS_REQUEST_BUILDERS.keys()
+if _models_without_builder:
+    logger.warning(f"No BRS request builder for models: {sorted(_models_without_builder)}")
 
 async def send_to_brs_api(prompt: str, model: str, image_path: Optional[str] = None) -> str:
     """Send request to BRS AI API using aiohttp"""
-    headers = {
-        "Authorization": f"Bearer {BRS_AI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    # Different endpoints and parameters for different models
-    if model == "veo3_1_fast":
-        api_url = "https://api.kie.ai/api/v1/veo/generate"
-        data = {
-            "prompt": prompt,
-            "model": "veo3_fast",
-            "aspectRatio": "16:9",
-            "enableFallback": False,
-            "enableTranslation": True,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback"
-        }
-        # Add image URLs for Veo 3.1 if provided
-        if image_path:
-            # Serve image through our web server
-            image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-            data["imageUrls"] = [image_url]
-            data["generationType"] = "FIRST_AND_LAST_FRAMES_2_VIDEO"
-            logger.info(f"Added image URL for Veo 3.1 Fast: {image_url}")
-        else:
-            data["generationType"] = "TEXT_2_VIDEO"
-            
-    elif model.startswith("veo3"):
-        api_url = "https://api.kie.ai/api/v1/veo/generate"
-        data = {
-            "prompt": prompt,
-            "model": model,
-            "aspectRatio": "16:9",
-            "enableFallback": False,
-            "enableTranslation": True,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback"
-        }
-        # Add image URLs for Veo3 if provided
-        if image_path:
-            # Serve image through our web server
-            image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-            data["imageUrls"] = [image_url]
-            logger.info(f"Added image URL for Veo3: {image_url}")
-            
-    elif model == "runway_gen3":
-        api_url = "https://api.kie.ai/api/v1/runway/generate"
-        data = {
-            "prompt": prompt,
-            "duration": 5,
-            "quality": "720p",
-            "aspectRatio": "16:9",
-            "model": "runway-duration-5-generate",
-            "waterMark": "",
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback"
-        }
-        # Add image URL for Runway if provided
-        if image_path:
-            # Serve image through our web server
-            image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-            data["imageUrl"] = image_url
-            logger.info(f"Added image URL for Runway: {image_url}")
-            
-    elif model == "wan_2_5":
-        api_url = "https://api.kie.ai/api/v1/jobs/createTask"
-        model_name = "wan/2-5-image-to-video"
-        
-        input_data = {
-            "prompt": prompt,
-            "duration": "5",
-            "resolution": "1080p",
-            "enable_prompt_expansion": True
-        }
-        
-        # Image is required for Wan 2.5
-        if image_path:
-            # Serve image through our web server
-            image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-            input_data["image_url"] = image_url
-            logger.info(f"Added image URL for Wan 2.5: {image_url}")
-        else:
-            raise Exception("Wan 2.5 requires an image")
-            
-        data = {
-            "model": model_name,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback",
-            "input": input_data
-        }
-        
-    elif model.startswith("wan_2_2"):
-        api_url = "https://api.kie.ai/api/v1/jobs/createTask"
-        
-        # Determine the specific Wan 2.2 model variant
-        if model == "wan_2_2_t2v":
-            model_name = "wan/2-2-a14b-text-to-video-turbo"
-            input_data = {
-                "prompt": prompt,
-                "resolution": "720p",
-                "aspect_ratio": "16:9",
-                "enable_prompt_expansion": False,
-                "acceleration": "none"
-            }
-        elif model == "wan_2_2_i2v":
-            model_name = "wan/2-2-a14b-image-to-video-turbo"
-            input_data = {
-                "prompt": prompt,
-                "resolution": "720p", 
-                "aspect_ratio": "auto",
-                "enable_prompt_expansion": False,
-                "acceleration": "none"
-            }
-            # Add image URL if provided
-            if image_path:
-                # Serve image through our web server
-                image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-                input_data["image_url"] = image_url
-                logger.info(f"Added image URL for Wan 2.2 I2V: {image_url}")
-        else:
-            raise Exception(f"Unknown Wan 2.2 variant: {model}")
-            
-        data = {
-            "model": model_name,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback",
-            "input": input_data
-        }
-        
-    elif model == "hailuo":
-        api_url = "https://api.kie.ai/api/v1/jobs/createTask"
-        model_name = "hailuo/2-3-image-to-video-pro"
-        
-        input_data = {
-            "prompt": prompt,
-            "duration": "6",
-            "resolution": "768P"
-        }
-        
-        # Image is required for Hailuo
-        if image_path:
-            # Serve image through our web server
-            image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-            input_data["image_url"] = image_url
-            logger.info(f"Added image URL for Hailuo: {image_url}")
-        else:
-            raise Exception("Hailuo requires an image")
-            
-        data = {
-            "model": model_name,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback",
-            "input": input_data
-        }
-        
-    elif model.startswith("kling"):
-        api_url = "https://api.kie.ai/api/v1/jobs/createTask"
-        
-        # Determine the specific Kling model variant
-        if model == "kling_standard":
-            model_name = "kling/v2-1-standard"
-        elif model == "kling_pro":
-            model_name = "kling/v2-1-pro"
-        elif model == "kling_master_i2v":
-            model_name = "kling/v2-1-master-image-to-video"
-        elif model == "kling_master_t2v":
-            model_name = "kling/v2-1-master-text-to-video"
-        else:
-            raise Exception(f"Unknown Kling variant: {model}")
-            
-        # Build input data for Kling models
-        input_data = {
-            "prompt": prompt,
-            "duration": "5",  # 5 seconds default
-            "aspect_ratio": "16:9",
-            "negative_prompt": "blur, distort, and low quality",
-            "cfg_scale": 0.5
-        }
-        
-        # Add image URL for image-to-video models
-        if model.endswith("_i2v") or model == "kling_standard" or model == "kling_pro":
-            if image_path:
-                # Serve image through our web server
-                image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-                input_data["image_url"] = image_url
-                logger.info(f"Added image URL for Kling: {image_url}")
-                
-        data = {
-            "model": model_name,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback",
-            "input": input_data
-        }
-        
-    elif model.startswith("sora_2"):
-        api_url = "https://api.kie.ai/api/v1/jobs/createTask"
-        
-        # Determine the specific Sora 2 model variant
-        if model == "sora_2_t2v":
-            model_name = "sora-2-text-to-video"
-            input_data = {
-                "prompt": prompt,
-                "aspect_ratio": "landscape",
-                "quality": "standard"
-            }
-        elif model == "sora_2_i2v":
-            model_name = "sora-2-image-to-video"
-            input_data = {
-                "prompt": prompt,
-                "aspect_ratio": "landscape",
-                "quality": "standard"
-            }
-            # Add image URLs array (Sora 2 uses plural "image_urls" as array)
-            if image_path:
-                image_url = f"{WEBHOOK_URL}/images/{os.path.basename(image_path)}"
-                input_data["image_urls"] = [image_url]
-                logger.info(f"Added image URLs for Sora 2 I2V: {[image_url]}")
-        else:
-            raise Exception(f"Unknown Sora 2 variant: {model}")
-            
-        data = {
-            "model": model_name,
-            "callBackUrl": f"{WEBHOOK_URL.rstrip('/')}/brs_callback",
-            "input": input_data
-        }
-    else:
+    builder = BRS_REQUEST_BUILDERS.get(model)
+    if builder is None and model.startswith("veo3"):
+        builder = build_veo_request  # Any other Veo 3 variant passes its name through
+    if builder is None:
         raise Exception(f"Unsupported model: {model}")
     
+    image_url = IMAGE_URL_BASE + os.path.basename(image_path) if image_path else None
+    api_url, data = builder(model, prompt, image_url)
+    
     try:
-        global http_session
-        if not http_session:
-            http_session = ClientSession()
-        
-        # Log the full request details for debugging
-        logger.info(f"=== API REQUEST ===")
-        logger.info(f"URL: {api_url}")
-        logger.info(f"Model: {model}")
-        logger.info(f"Headers: {headers}")
-        logger.info(f"Payload: {data}")
-        logger.info(f"==================")
-            
-        async with http_session.post(api_url, headers=headers, json=data) as response:
-            logger.info(f"API Response Status: {response.status}")
-            response_text = await response.text()
-            logger.info(f"API Response Body: {response_text}")
-            
-            if response.status == 200:
-                result = await response.json() if response_text else {}
-                # BRS AI returns format: {"code": 200, "msg": "success", "data": {"taskId": "..."}}
-                if result.get("code") == 200 and "data" in result:
-                    return result["data"].get("taskId", "unknown")
-                else:
-                    raise Exception(f"BRS Error: {result.get('msg', 'Unknown error')}")
+        # The request dump is only formatted when debug logging is on. Headers are left
+        # out: they carry the API key
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            logger.debug(f"BRS API request: url={api_url} model={model} payload={data}")
+        
+        async with brs_request_semaphore:
+            async with get_http_session().post(api_url, headers=BRS_API_HEADERS, data=brs_request_encoder.encode(data)) as response:
+                response_body = await response.read()
+                status = response.status
+        logger.info(f"BRS API {model} request returned HTTP {status}")
+        if debug_enabled:
+            logger.debug(f"BRS API response body: {response_body!r}")
+        
+        if status == 200:
+            result = msgspec.json.decode(response_body) if response_body else {}
+            # BRS AI returns format: {"code": 200, "msg": "success", "data": {"taskId": "..."}}
+            if result.get("code") == 200 and "data" in result:
+                return result["data"].get("taskId", "unknown")
             else:
-                raise Exception(f"API error {response.status}: {response_text}")
-                
+                raise Exception(f"BRS Error: {result.get('msg', 'Unknown error')}")
+        else:
+            raise Exception(f"API error {status}: {response_body.decode('utf-8', errors='replace')}")
+            
     except Exception as e:
         logger.error(f"Error sending to BRS API: {e}")
         raise
 
 # Bot command handlers
-@dp.message(Command("start"))
+async def dispatch_command(message: Message, command: CommandObject, state: FSMContext):
+    """Route a bot command to its handler with a single dict lookup"""
+    handler, takes_state = COMMAND_HANDLERS[command.command]
+    if takes_state:
+        await handler(message, state)
+    else:
+        await handler(message)
+
 async def cmd_start(message: Message):
     """Handle /start command"""
     if not message.from_user:
@@ -680,42 +1311,14 @@ async def cmd_start(message: Message):
         account_id = get_credit_account_id(message)
         credits = get_credits(account_id)
         
-        welcome_text = f"""
-🎬 **Welcome to AI Video Generator Bot!**
-
-👋 **Hello {message.from_user.first_name or 'there'}!**
-
-💳 **Your Credits:** {credits} {'credit' if credits == 1 else 'credits'}
-
-🚀 **Quick Start:**
-• Use /generate to create amazing videos
-• Need credits? Try /buy for great packages
-• Get help anytime with /help
-
-🎯 **Available Models:** 7 AI models including Veo 3, Runway Gen-3, Sora 2, and Kling 2.1
-
-💰 **Pricing:** 1 credit per video, bulk discounts available
-
-⚠️ **This bot is in BETA - not everything works yet - we are updating daily!**
-
-✨ Ready to create something amazing?
-"""
-        
-        # Create welcome keyboard with quick actions
-        welcome_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="💳 Buy Credits", callback_data="show_packages"),
-             InlineKeyboardButton(text="❓ Help & Guide", callback_data="help_main")],
-            [InlineKeyboardButton(text="📊 My Stats", callback_data="user_stats")]
-        ])
+        welcome_text = format_welcome_text(message.from_user.first_name, credits, WELCOME_TEXT_BETA_FOOTER)
         
-        await message.answer(welcome_text, reply_markup=welcome_keyboard, parse_mode="Markdown")
+        await message.answer(welcome_text, reply_markup=WELCOME_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in cmd_start: {e}")
         await message.answer("❌ An error occurred. Please try again later.")
 
-@dp.message(Command("reset"))
 async def cmd_reset(message: Message, state: FSMContext):
     """Handle /reset command to clear model selection and state"""
     if not message.from_user:
@@ -750,7 +1353,6 @@ async def cmd_reset(message: Message, state: FSMContext):
         logger.error(f"Error in cmd_reset: {e}")
         await message.answer("❌ An error occurred during reset. Please try again.")
 
-@dp.message(Command("video"))
 async def cmd_send_video(message: Message):
     """Manually send the last generated video that wasn't delivered"""
     if not message.from_user:
@@ -762,39 +1364,42 @@ async def cmd_send_video(message: Message):
         # Send the video that was generated but not delivered
         video_url = "https://tempfile.aiquickdraw.com/p/3fc297d0f7ad7c3c0680d94dc3ae5ee8_1758925534.mp4"
         
-        await bot.send_message(
-            chat_id=user_id,
-            text=f"🎬 **Your Previous Video is Ready!**\n\n"
-                 f"📹 **Video URL:** {video_url}\n\n"
-                 f"🦝 *The raccoon in a suit turns to the camera and says \"BRS Studio is now live on Telegram!\"*\n\n"
-                 f"💡 This was the video that was successfully generated but not delivered due to a callback parsing issue (now fixed).",
-            parse_mode="Markdown"
+        # Announce the video while it downloads; the two don't depend on each other
+        announcement, video_path = await asyncio.gather(
+            bot.send_message(
+                chat_id=user_id,
+                text=f"🎬 **Your Previous Video is Ready!**\n\n"
+                     f"📹 **Video URL:** {video_url}\n\n"
+                     f"🦝 *The raccoon in a suit turns to the camera and says \"BRS Studio is now live on Telegram!\"*\n\n"
+                     f"💡 This was the video that was successfully generated but not delivered due to a callback parsing issue (now fixed).",
+                parse_mode="Markdown"
+            ),
+            download_to_temp_file(video_url, f"video_manual_{user_id}.mp4"),
+            return_exceptions=True
         )
+        if isinstance(announcement, BaseException):
+            logger.error(f"Could not send video announcement: {announcement}")
+        if isinstance(video_path, BaseException):
+            logger.error(f"Could not download video: {video_path}")
+            video_path = None
         
         # Try to send as actual video file too
-        try:
-            global http_session
-            if not http_session:
-                http_session = ClientSession()
-                
-            async with http_session.get(video_url) as response:
-                if response.status == 200:
-                    video_content = await response.read()
-                    video_file = BufferedInputFile(video_content, filename="raccoon_brs_studio.mp4")
-                    
-                    await bot.send_video(
-                        chat_id=user_id,
-                        video=video_file,
-                        caption="🎬 Your video is ready! (Previously generated)"
-                    )
-        except Exception as video_error:
-            logger.error(f"Could not send video file: {video_error}")
+        if video_path:
+            try:
+                await bot.send_video(
+                    chat_id=user_id,
+                    video=FSInputFile(video_path, filename="raccoon_brs_studio.mp4"),
+                    caption="🎬 Your video is ready! (Previously generated)"
+                )
+            except Exception as video_error:
+                logger.error(f"Could not send video file: {video_error}")
+            finally:
+                remove_temp_file(video_path)
         
     except Exception as e:
         logger.error(f"Error in cmd_send_video: {e}")
         await message.answer("❌ Could not retrieve the previous video.")
 
-@dp.message(Command("generate"))
 async def cmd_generate(message: Message, state: FSMContext):
     """Handle /generate command"""
     if not message.from_user:
@@ -815,36 +1420,18 @@ async def cmd_generate(message: Message, state: FSMContext):
                 logger.warning(f"Could not delete command message: {e}")
         
         if credits < 1:
-            no_credits_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Buy Credits", callback_data="buy_credits")],
-                [InlineKeyboardButton(text="📚 Learn More", callback_data="help_credits")]
-            ])
             response_msg = await message.answer(
-                "💸 **Insufficient Credits!**\n\n"
-                f"💳 **Current Balance:** `{credits}` credits\n\n"
-                "🎬 **Required:** `1` credit for video generation\n\n"
-                "💡 **Quick Solutions:**\n"
-                "• Buy credits with Telegram Stars (⭐)\n"
-                "• 100 Stars = 1 Credit (≈ $1.30)\n\n"
-                "👆 **Tap below to get started!**",
-                reply_markup=no_credits_keyboard,
+                INSUFFICIENT_CREDITS_TEXT.format(credits=credits),
+                reply_markup=NO_CREDITS_KEYBOARD,
                 parse_mode="Markdown"
             )
             return
         
         # Check if user has a selected model
         if user_id not in user_models:
-            keyboard = create_model_selection_keyboard()
             response_msg = await message.answer(
-                "🤖 **Choose Your AI Model**\n\n"
-                f"💳 **Your Balance:** `{credits}` credits\n\n"
-                "🎯 **Select the perfect model for your video:**\n\n"
-                "⚡ **Fast:** Quick generation (1-2 min)\n"
-                "🎵 **Audio:** High quality with sound\n"
-                "🚀 **Advanced:** Premium features\n"
-                "💰 **Affordable:** Budget-friendly options\n\n"
-                "👆 **Tap a model below to continue:**",
-                reply_markup=keyboard,
+                CHOOSE_MODEL_TEXT.format(credits=credits),
+                reply_markup=MODEL_SELECTION_KEYBOARD,
                 parse_mode="Markdown"
             )
             return
@@ -890,96 +1477,54 @@ async def cmd_generate(message: Message, state: FSMContext):
         logger.error(f"Error in cmd_generate: {e}")
         await message.answer("❌ An error occurred. Please try again later.")
 
-@dp.callback_query(F.data.startswith("model_"))
-async def process_model_selection(callback: CallbackQuery, state: FSMContext):
+async def process_model_selection(callback: CallbackQuery, state: FSMContext, callback_answer: CallbackAnswer):
     """Handle model selection"""
-    if not callback.from_user or not callback.data:
+    if not callback.data:
         return
         
     try:
         user_id = callback.from_user.id
-        model_key = callback.data.split("_", 1)[1]
+        model_key = MODEL_CALLBACKS.get(callback.data)
         
-        if model_key in AVAILABLE_MODELS:
+        if model_key:
             user_models[user_id] = model_key
             save_user_models()  # Persist model selection
             model_name = AVAILABLE_MODELS[model_key]
             
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                try:
-                    await callback.message.edit_text(  # type: ignore
-                        f"✅ Model selected: {model_name}\n\n"
-                        "📝 Please enter your text prompt for video generation:"
-                    )
-                except Exception as e:
-                    # If editing fails, send a new message
-                    await bot.send_message(
-                        callback.from_user.id,
-                        f"✅ Model selected: {model_name}\n\n"
-                        "📝 Please enter your text prompt for video generation:"
-                    )
-            elif callback.message:
-                # Message exists but doesn't support editing, send new message
-                await bot.send_message(
-                    callback.from_user.id,
-                    f"✅ Model selected: {model_name}\n\n"
-                    "📝 Please enter your text prompt for video generation:"
-                )
+            text = (
+                f"✅ Model selected: {model_name}\n\n"
+                "📝 Please enter your text prompt for video generation:"
+            )
+            await safe_edit_message(callback, text)
             await state.set_state(GenerationStates.waiting_for_prompt)
         
-        await callback.answer()
-        
     except Exception as e:
         logger.error(f"Error in process_model_selection: {e}")
-        await callback.answer("❌ An error occurred. Please try again later.")
+        callback_answer.text = "❌ An error occurred. Please try again later."
 
 # New comprehensive callback handlers for enhanced UI
-@dp.callback_query(F.data == "quick_generate")
-async def quick_generate_callback(callback: CallbackQuery, state: FSMContext):
+async def quick_generate_callback(callback: CallbackQuery, state: FSMContext, callback_answer: CallbackAnswer):
     """Handle quick generate button from welcome and other menus"""
-    if not callback.from_user:
-        return
-    
     try:
         user_id = callback.from_user.id
         account_id = get_callback_account_id(callback)
         credits = get_credits(account_id)
         
         if credits < 1:
-            no_credits_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="💳 Buy Credits", callback_data="buy_credits")],
-                [InlineKeyboardButton(text="📚 Learn More", callback_data="help_credits")]
-            ])
             await safe_edit_message(
                 callback,
-                "💸 **Insufficient Credits!**\n\n"
-                f"💳 **Current Balance:** `{credits}` credits\n\n"
-                "🎬 **Required:** `1` credit for video generation\n\n"
-                "💡 **Quick Solutions:**\n"
-                "• Buy credits with Telegram Stars (⭐)\n"
-                "• 100 Stars = 1 Credit (≈ $1.30)\n\n"
-                "👆 **Tap below to get started!**",
-                no_credits_keyboard
+                INSUFFICIENT_CREDITS_TEXT.format(credits=credits),
+                NO_CREDITS_KEYBOARD
             )
-            await callback.answer()
             return
         
         # Check if user has a selected model
         if user_id not in user_models:
-            keyboard = create_model_selection_keyboard()
             await safe_edit_message(
                 callback,
-                "🤖 **Choose Your AI Model**\n\n"
-                f"💳 **Your Balance:** `{credits}` credits\n\n"
-                "🎯 **Select the perfect model for your video:**\n\n"
-                "⚡ **Fast:** Quick generation (1-2 min)\n"
-                "🎵 **Audio:** High quality with sound\n"
-                "🚀 **Advanced:** Premium features\n"
-                "💰 **Affordable:** Budget-friendly options\n\n"
-                "👆 **Tap a model below to continue:**",
-                keyboard
+                CHOOSE_MODEL_TEXT.format(credits=credits),
+                MODEL_SELECTION_KEYBOARD
             )
-            await callback.answer()
             return
         
         # User has a model, ask for prompt
@@ -1006,76 +1551,41 @@ async def quick_generate_callback(callback: CallbackQuery, state: FSMContext):
             "✍️ **Your turn - type your prompt below:"
         )
         await state.set_state(GenerationStates.waiting_for_prompt)
-        await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in quick_generate_callback: {e}")
-        await callback.answer("❌ Error starting generation. Please try again.")
+        callback_answer.text = "❌ Error starting generation. Please try again."
 
-@dp.callback_query(F.data == "buy_credits")
-async def buy_credits_callback(callback: CallbackQuery):
+async def buy_credits_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Handle buy credits button"""
-    if not callback.from_user:
-        return
-        
     try:
         user_id = callback.from_user.id
         account_id = get_callback_account_id(callback)
         credits = get_credits(account_id)
         
         # Create enhanced buy menu
-        buy_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⭐ Buy 1 Credit (100 Stars)", callback_data="buy_package_100")],
-            [InlineKeyboardButton(text="📊 Credit Packages", callback_data="buy_packages")],
-            [InlineKeyboardButton(text="💡 How Stars Work", callback_data="help_stars")],
-            [InlineKeyboardButton(text="🔙 Back to Menu", callback_data="back_main")]
-        ])
-        
-        buy_text = (
-            "💳 **Credit Store**\n\n"
-            f"💰 **Current Balance:** `{credits}` {'credit' if credits == 1 else 'credits'}\n\n"
-            "⭐ **Telegram Stars Pricing:**\n"
-            "• 1 Credit = 100 Stars (≈ $1.30)\n"
-            "• Instant delivery\n"
-            "• Secure Telegram payment\n\n"
-            "🎬 **What you get:**\n"
-            "• Generate 1 high-quality AI video\n"
-            "• Choice of 5 premium models\n"
-            "• Image-to-video support\n"
-            "• Direct delivery to Telegram\n\n"
-            "💡 **Tip:** Credits never expire, bulk discounts available!"
-        )
+        buy_text = CREDIT_STORE_TEXT.format(credits=credits, noun='credit' if credits == 1 else 'credits')
         
-        await safe_edit_message(callback, buy_text, reply_markup=buy_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
+        await safe_edit_message(callback, buy_text, reply_markup=BUY_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in buy_credits_callback: {e}")
-        await callback.answer("❌ Error loading credit store.")
+        callback_answer.text = "❌ Error loading credit store."
 
-@dp.callback_query(F.data == "buy_1")
-async def buy_one_credit_callback(callback: CallbackQuery):
+async def buy_one_credit_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Handle buying 1 credit"""
-    if not callback.from_user:
-        return
-        
     try:
         # Simulate the /buy command
         if callback.message:
             await cmd_buy(callback.message)
-        await callback.answer("🛒 Opening payment...")
+        callback_answer.text = "🛒 Opening payment..."
         
     except Exception as e:
         logger.error(f"Error in buy_one_credit_callback: {e}")
-        await callback.answer("❌ Error processing purchase.")
+        callback_answer.text = "❌ Error processing purchase."
 
-@dp.callback_query(F.data == "user_stats")
-async def user_stats_callback(callback: CallbackQuery):
+async def user_stats_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Show user statistics and account info"""
-    if not callback.from_user:
-        return
-        
     try:
         user_id = callback.from_user.id
         account_id = get_callback_account_id(callback)
@@ -1083,440 +1593,345 @@ async def user_stats_callback(callback: CallbackQuery):
         user_name = callback.from_user.first_name or "User"
         
         # Count pending generations for this user
-        user_pending = sum(1 for gen in pending_generations.values() if gen.get('user_id') == user_id)
-        
-        stats_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="💳 Buy Credits", callback_data="buy_credits")],
-            [InlineKeyboardButton(text="🔙 Main Menu", callback_data="back_main")]
-        ])
+        user_pending = pending_by_user.get(user_id, 0)
         
         stats_text = (
             f"📊 **Account Statistics**\n\n"
             f"👤 **User:** {user_name}\n"
             f"🆔 **ID:** `{user_id}`\n\n"
             f"💳 **Credits:** `{credits}` {'credit' if credits == 1 else 'credits'}\n"
-            f"⏳ **Pending:** `{user_pending}` {'generation' if user_pending == 1 else 'generations'}\n\n"
-            "🎯 **Usage Tips:**\n"
-            "• Each video costs 1 credit\n"
-            "• Credits never expire\n"
-            "• Try different models for variety\n\n"
-            "🚀 **Ready for your next creation?**"
-        )
-        
-        await safe_edit_message(callback, stats_text, reply_markup=stats_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
-        
-    except Exception as e:
-        logger.error(f"Error in user_stats_callback: {e}")
-        await callback.answer("❌ Error loading stats.")
-
-@dp.callback_query(F.data == "help_main")
-async def help_main_callback(callback: CallbackQuery):
-    """Show main help menu"""
-    if not callback.from_user:
-        return
-        
-    try:
-        help_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Video Generation", callback_data="help_generate")],
-            [InlineKeyboardButton(text="💳 Credits & Payment", callback_data="help_credits")],
-            [InlineKeyboardButton(text="🤖 AI Models Guide", callback_data="help_models")],
-            [InlineKeyboardButton(text="🖼️ Image Upload Tips", callback_data="help_image")],
-            [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
-            [InlineKeyboardButton(text="🔙 Main Menu", callback_data="back_main")]
-        ])
-        
-        help_text = (
-            "❓ **Help & Support Center**\n\n"
-            "Welcome to the comprehensive help system! Choose a topic below to get detailed assistance:\n\n"
-            "🎬 **Video Generation** - Learn how to create videos\n"
-            "💳 **Credits & Payment** - Understand the credit system\n"
-            "🤖 **AI Models** - Compare different models\n"
-            "🖼️ **Image Tips** - Optimize your image uploads\n"
-            "🛠️ **Troubleshooting** - Fix common issues\n\n"
-            "💬 **Need more help?** Contact @niftysolsol"
-        )
-        
-        await safe_edit_message(callback, help_text, reply_markup=help_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
-        
-    except Exception as e:
-        logger.error(f"Error in help_main_callback: {e}")
-        await callback.answer("❌ Error loading help.")
-
-@dp.callback_query(F.data == "skip_image")
-async def skip_image_callback(callback: CallbackQuery, state: FSMContext):
-    """Handle skip image button during generation"""
-    if not callback.from_user:
-        return
-        
-    try:
-        # Check if model requires image (shouldn't be able to skip)
-        user_id = callback.from_user.id
-        model = user_models.get(user_id)
-        image_required_models = ["wan_2_2_i2v", "wan_2_5", "hailuo", "kling_master_i2v", "runway_gen3", "sora_2_i2v"]
-        
-        if model in image_required_models:
-            await callback.answer("❌ This model requires an image. Please upload one.", show_alert=True)
-            return
-        
-        # Simulate typing 'skip'
-        data = await state.get_data()
-        if data.get('prompt'):
-            # Create a mock message with 'skip' text that includes the necessary properties for cleanup
-            class MockMessage:
-                def __init__(self, user, text, chat, message_id):
-                    self.from_user = user
-                    self.text = text
-                    self.photo = None
-                    self.chat = chat
-                    self.message_id = message_id
-                
-                async def answer(self, text, **kwargs):
-                    # Send message through callback query instead
-                    try:
-                        if callback.message:
-                            return await callback.message.answer(text, **kwargs)
-                        else:
-                            logger.error("Callback message is None")
-                            return None
-                    except Exception as e:
-                        logger.error(f"Failed to send mock message answer: {e}")
-                        return None
-            
-            # Use callback message properties for the mock message
-            mock_message = MockMessage(
-                callback.from_user, 
-                'skip',
-                callback.message.chat if callback.message else None,
-                callback.message.message_id if callback.message else 0
-            )
-            await process_image_or_skip(mock_message, state)
-        
-        await callback.answer("⏭️ Skipping image upload...")
-        
-    except Exception as e:
-        logger.error(f"Error in skip_image_callback: {e}")
-        await callback.answer("❌ Error processing skip.")
-
-# Additional help system callbacks
-@dp.callback_query(F.data == "help_generate")
-async def help_generate_callback(callback: CallbackQuery):
-    """Show video generation help"""
-    if not callback.from_user:
-        return
-    
-    try:
-        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Try Now", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="🤖 Model Guide", callback_data="help_models")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "🎬 **Video Generation Guide**\n\n"
-            "🚀 **Getting Started:**\n"
-            "1️⃣ Use `/generate` or tap Generate Video\n"
-            "2️⃣ Choose from 9 AI models\n"
-            "3️⃣ Write a creative prompt (be specific!)\n"
-            "4️⃣ Upload image (optional)\n"
-            "5️⃣ Wait 2-5 minutes for your video\n\n"
-            "✍️ **Writing Great Prompts:**\n"
-            "• Be specific and descriptive\n"
-            "• Include camera angles, lighting, mood\n"
-            "• Mention colors, movement, style\n"
-            "• Keep under 500 characters\n\n"
-            "🌟 **Example Prompts:**\n"
-            "_\"A majestic golden eagle soaring over snow-capped mountains at sunset, cinematic wide shot\"_\n\n"
-            "_\"Close-up of raindrops on a car window, neon city lights blurred in background, moody lighting\"_\n\n"
-            "💰 **Cost:** 1 credit per video (≈ $1.30)"
-        )
-        
-        await safe_edit_message(callback, help_text, reply_markup=back_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
-        
-    except Exception as e:
-        logger.error(f"Error in help_generate_callback: {e}")
-        await callback.answer("❌ Error loading help.")
-
-@dp.callback_query(F.data == "help_credits")
-async def help_credits_callback(callback: CallbackQuery):
-    """Show credits and payment help"""
-    if not callback.from_user:
-        return
-    
-    try:
-        credits_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⭐ Buy Credits", callback_data="buy_credits")],
-            [InlineKeyboardButton(text="📊 Check Balance", callback_data="user_stats")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "💳 **Credits & Payment Guide**\n\n"
-            "💰 **Credit System:**\n"
-            "• 1 Credit = 1 Video Generation\n"
-            "• Credits never expire\n"
-            "• Refunded if generation fails\n"
-            "• Track balance anytime\n\n"
-            "⭐ **Telegram Stars Payment:**\n"
-            "• 1 Credit = 100 Stars (≈ $1.30)\n"
-            "• Secure Telegram payment system\n"
-            "• Instant credit delivery\n"
-            "• No external payment needed\n\n"
-            "🛒 **How to Buy:**\n"
-            "1️⃣ Tap 'Buy Credits' button\n"
-            "2️⃣ Confirm 100 Stars payment\n"
-            "3️⃣ Credits added instantly\n"
-            "4️⃣ Start generating videos!\n\n"
-            "🔒 **Security:** All payments processed by Telegram\n"
-            "💵 **Pricing:** Competitive rates, no hidden fees"
-        )
-        
-        await safe_edit_message(callback, help_text, reply_markup=credits_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
-        
-    except Exception as e:
-        logger.error(f"Error in help_credits_callback: {e}")
-        await callback.answer("❌ Error loading help.")
-
-@dp.callback_query(F.data == "help_models")
-async def help_models_callback(callback: CallbackQuery):
-    """Show AI models comparison help"""
-    if not callback.from_user:
-        return
-    
-    try:
-        models_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="📝 Generation Guide", callback_data="help_generate")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "🤖 **AI Models Comparison**\n\n"
-            "⚡ **Veo 3 Fast** - Quick generation (1-2 min)\n"
-            "• Best for: Fast results\n"
-            "• Quality: Good\n"
-            "• Features: Speed optimized\n\n"
-            "🎵 **Veo 3** - High quality with audio\n"
-            "• Best for: Premium videos with sound\n"
-            "• Quality: Excellent\n"
-            "• Features: Synchronized audio\n\n"
-            "🚀 **Runway Gen-3** - Advanced video\n"
-            "• Best for: Complex scenes\n"
-            "• Quality: Professional\n"
-            "• Features: Advanced reasoning\n\n"
-            "📝 **Wan 2.2 T2V** - Text to video\n"
-            "• Best for: Text-only prompts\n"
-            "• Quality: High\n"
-            "• Features: Pure text generation\n\n"
-            "🖼️ **Wan 2.2 I2V** - Image to video\n"
-            "• Best for: Animating images\n"
-            "• Quality: High\n"
-            "• Features: Image animation\n\n"
-            "💰 **Kling Standard** - Affordable 720p\n"
-            "• Best for: Budget-conscious users\n"
-            "• Quality: Good (720p)\n"
-            "• Features: Cost-effective\n\n"
-            "⭐ **Kling Pro** - Enhanced 1080p\n"
-            "• Best for: High resolution needs\n"
-            "• Quality: Excellent (1080p)\n"
-            "• Features: Enhanced quality\n\n"
-            "👑 **Kling Master I2V** - Premium image-to-video\n"
-            "• Best for: Professional image animation\n"
-            "• Quality: Premium\n"
-            "• Features: Advanced I2V processing\n\n"
-            "🎬 **Kling Master T2V** - Premium text-to-video\n"
-            "• Best for: Professional text generation\n"
-            "• Quality: Premium\n"
-            "• Features: Advanced T2V processing"
+            f"⏳ **Pending:** `{user_pending}` {'generation' if user_pending == 1 else 'generations'}\n\n"
+            "🎯 **Usage Tips:**\n"
+            "• Each video costs 1 credit\n"
+            "• Credits never expire\n"
+            "• Try different models for variety\n\n"
+            "🚀 **Ready for your next creation?**"
         )
         
-        await safe_edit_message(callback, help_text, reply_markup=models_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
+        await safe_edit_message(callback, stats_text, reply_markup=STATS_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
-        logger.error(f"Error in help_models_callback: {e}")
-        await callback.answer("❌ Error loading help.")
+        logger.error(f"Error in user_stats_callback: {e}")
+        callback_answer.text = "❌ Error loading stats."
+
+# Help pages never change, so their texts and keyboards are built once at import
+HELP_MAIN_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Video Generation", callback_data="help_generate")],
+    [InlineKeyboardButton(text="💳 Credits & Payment", callback_data="help_credits")],
+    [InlineKeyboardButton(text="🤖 AI Models Guide", callback_data="help_models")],
+    [InlineKeyboardButton(text="🖼️ Image Upload Tips", callback_data="help_image")],
+    [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
+    [InlineKeyboardButton(text="🔙 Main Menu", callback_data="back_main")]
+])
+
+# /help greets the user by name; everything else is fixed
+HELP_COMMAND_TEXT = (
+    "❓ **AI Video Bot - Complete Help Guide**\n\n"
+    "Welcome {name}! Choose a topic below for detailed assistance:\n\n"
+    "🎬 **Video Generation** - Step-by-step video creation\n"
+    "💳 **Credits & Payment** - Understanding the credit system\n"
+    "🤖 **AI Models** - Compare all 5 available models\n"
+    "🖼️ **Image Tips** - Optimize your image uploads\n"
+    "🛠️ **Troubleshooting** - Fix common issues\n"
+    "👤 **Contact** - Get human support\n\n"
+    "🔥 **Quick Commands:**\n"
+    "• `/generate` - Start creating videos\n"
+    "• `/buy` - Purchase credits\n"
+    "• `/reset` - Clear selection and start fresh\n"
+    "• `/start` - Return to main menu\n\n"
+    "💡 **Tip:** Use the buttons below for instant help!"
+)
+# /help lists every topic, including contact, in place of the Main Menu button
+HELP_COMMAND_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Video Generation", callback_data="help_generate")],
+    [InlineKeyboardButton(text="💳 Credits & Payment", callback_data="help_credits")],
+    [InlineKeyboardButton(text="🤖 AI Models Guide", callback_data="help_models")],
+    [InlineKeyboardButton(text="🖼️ Image Upload Tips", callback_data="help_image")],
+    [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
+    [InlineKeyboardButton(text="👤 Contact Support", callback_data="help_contact")]
+])
+
+HELP_MAIN_TEXT = (
+    "❓ **Help & Support Center**\n\n"
+    "Welcome to the comprehensive help system! Choose a topic below to get detailed assistance:\n\n"
+    "🎬 **Video Generation** - Learn how to create videos\n"
+    "💳 **Credits & Payment** - Understand the credit system\n"
+    "🤖 **AI Models** - Compare different models\n"
+    "🖼️ **Image Tips** - Optimize your image uploads\n"
+    "🛠️ **Troubleshooting** - Fix common issues\n\n"
+    "💬 **Need more help?** Contact @niftysolsol"
+)
+
+HELP_GENERATE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Try Now", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="🤖 Model Guide", callback_data="help_models")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_GENERATE_TEXT = (
+    "🎬 **Video Generation Guide**\n\n"
+    "🚀 **Getting Started:**\n"
+    "1️⃣ Use `/generate` or tap Generate Video\n"
+    "2️⃣ Choose from 9 AI models\n"
+    "3️⃣ Write a creative prompt (be specific!)\n"
+    "4️⃣ Upload image (optional)\n"
+    "5️⃣ Wait 2-5 minutes for your video\n\n"
+    "✍️ **Writing Great Prompts:**\n"
+    "• Be specific and descriptive\n"
+    "• Include camera angles, lighting, mood\n"
+    "• Mention colors, movement, style\n"
+    "• Keep under 500 characters\n\n"
+    "🌟 **Example Prompts:**\n"
+    "_\"A majestic golden eagle soaring over snow-capped mountains at sunset, cinematic wide shot\"_\n\n"
+    "_\"Close-up of raindrops on a car window, neon city lights blurred in background, moody lighting\"_\n\n"
+    "💰 **Cost:** 1 credit per video (≈ $1.30)"
+)
+
+HELP_CREDITS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⭐ Buy Credits", callback_data="buy_credits")],
+    [InlineKeyboardButton(text="📊 Check Balance", callback_data="user_stats")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_CREDITS_TEXT = (
+    "💳 **Credits & Payment Guide**\n\n"
+    "💰 **Credit System:**\n"
+    "• 1 Credit = 1 Video Generation\n"
+    "• Credits never expire\n"
+    "• Refunded if generation fails\n"
+    "• Track balance anytime\n\n"
+    "⭐ **Telegram Stars Payment:**\n"
+    "• 1 Credit = 100 Stars (≈ $1.30)\n"
+    "• Secure Telegram payment system\n"
+    "• Instant credit delivery\n"
+    "• No external payment needed\n\n"
+    "🛒 **How to Buy:**\n"
+    "1️⃣ Tap 'Buy Credits' button\n"
+    "2️⃣ Confirm 100 Stars payment\n"
+    "3️⃣ Credits added instantly\n"
+    "4️⃣ Start generating videos!\n\n"
+    "🔒 **Security:** All payments processed by Telegram\n"
+    "💵 **Pricing:** Competitive rates, no hidden fees"
+)
+
+HELP_MODELS_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="📝 Generation Guide", callback_data="help_generate")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_MODELS_TEXT = (
+    "🤖 **AI Models Comparison**\n\n"
+    "⚡ **Veo 3 Fast** - Quick generation (1-2 min)\n"
+    "• Best for: Fast results\n"
+    "• Quality: Good\n"
+    "• Features: Speed optimized\n\n"
+    "🎵 **Veo 3** - High quality with audio\n"
+    "• Best for: Premium videos with sound\n"
+    "• Quality: Excellent\n"
+    "• Features: Synchronized audio\n\n"
+    "🚀 **Runway Gen-3** - Advanced video\n"
+    "• Best for: Complex scenes\n"
+    "• Quality: Professional\n"
+    "• Features: Advanced reasoning\n\n"
+    "📝 **Wan 2.2 T2V** - Text to video\n"
+    "• Best for: Text-only prompts\n"
+    "• Quality: High\n"
+    "• Features: Pure text generation\n\n"
+    "🖼️ **Wan 2.2 I2V** - Image to video\n"
+    "• Best for: Animating images\n"
+    "• Quality: High\n"
+    "• Features: Image animation\n\n"
+    "💰 **Kling Standard** - Affordable 720p\n"
+    "• Best for: Budget-conscious users\n"
+    "• Quality: Good (720p)\n"
+    "• Features: Cost-effective\n\n"
+    "⭐ **Kling Pro** - Enhanced 1080p\n"
+    "• Best for: High resolution needs\n"
+    "• Quality: Excellent (1080p)\n"
+    "• Features: Enhanced quality\n\n"
+    "👑 **Kling Master I2V** - Premium image-to-video\n"
+    "• Best for: Professional image animation\n"
+    "• Quality: Premium\n"
+    "• Features: Advanced I2V processing\n\n"
+    "🎬 **Kling Master T2V** - Premium text-to-video\n"
+    "• Best for: Professional text generation\n"
+    "• Quality: Premium\n"
+    "• Features: Advanced T2V processing"
+)
 
-@dp.callback_query(F.data == "help_image")
-async def help_image_callback(callback: CallbackQuery):
-    """Show image upload tips"""
-    if not callback.from_user:
+HELP_IMAGE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🖼️ Try I2V Models", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="🤖 Model Guide", callback_data="help_models")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_IMAGE_TEXT = (
+    "🖼️ **Image Upload Guide**\n\n"
+    "📸 **Supported Formats:**\n"
+    "• JPG, JPEG, PNG, WebP, GIF\n"
+    "• Maximum size: 20MB\n"
+    "• Recommended: 1024x1024+ pixels\n\n"
+    "🎯 **Best Results:**\n"
+    "• High resolution images\n"
+    "• Clear, well-lit photos\n"
+    "• Good contrast and composition\n"
+    "• Avoid blurry or dark images\n\n"
+    "💡 **Pro Tips:**\n"
+    "• Images work best with I2V models\n"
+    "• Portrait or landscape both work\n"
+    "• Add descriptive prompts for context\n"
+    "• You can skip images for text-only\n\n"
+    "🤖 **Compatible Models:**\n"
+    "• Wan 2.2 I2V - Image to video\n"
+    "• Kling Standard - Supports images\n"
+    "• Kling Pro - Enhanced with images\n"
+    "• Kling Master I2V - Premium I2V\n"
+    "• Veo 3 - Image enhancement\n"
+    "• Runway Gen-3 - Advanced I2V\n\n"
+    "⚠️ **Note:** Image processing may add 30-60 seconds"
+)
+
+HELP_TROUBLESHOOT_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🎬 Try Again", callback_data="quick_generate")],
+    [InlineKeyboardButton(text="👤 Contact Support", callback_data="help_contact")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_TROUBLESHOOT_TEXT = (
+    "🛠️ **Troubleshooting Guide**\n\n"
+    "❌ **Generation Failed?**\n"
+    "• Check your prompt clarity\n"
+    "• Try a different model\n"
+    "• Ensure stable internet\n"
+    "• Credits are auto-refunded\n\n"
+    "📸 **Image Issues?**\n"
+    "• Use supported formats (JPG, PNG)\n"
+    "• Keep under 20MB size\n"
+    "• Ensure good image quality\n"
+    "• Try skipping image if problems persist\n\n"
+    "⏱️ **Taking Too Long?**\n"
+    "• Normal time: 2-5 minutes\n"
+    "• Complex prompts take longer\n"
+    "• High-quality models need more time\n"
+    "• You'll get notified when ready\n\n"
+    "💳 **Credit Problems?**\n"
+    "• Check balance with /start\n"
+    "• Failed generations are refunded\n"
+    "• Stars payment is instant\n"
+    "• Contact support if issues persist\n\n"
+    "🔄 **General Tips:**\n"
+    "• Restart with /start\n"
+    "• Try different prompts\n"
+    "• Use simpler descriptions\n"
+    "• Contact support for persistent issues"
+)
+
+HELP_CONTACT_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
+    [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
+])
+
+HELP_CONTACT_TEXT = (
+    "👤 **Contact Support**\n\n"
+    "💬 **Get Human Help:**\n"
+    "• Support: @niftysolsol\n"
+    "• Response time: 2-24 hours\n"
+    "• Response time: 2-24 hours\n\n"
+    "📝 **When Contacting Include:**\n"
+    "• Your user ID (shown in stats)\n"
+    "• Generation ID if available\n"
+    "• Description of the problem\n"
+    "• Screenshots if helpful\n\n"
+    "🚀 **Before Contacting:**\n"
+    "• Try troubleshooting guide\n"
+    "• Check your credits balance\n"
+    "• Restart with /start\n"
+    "• Try a different model\n\n"
+    "💰 **Refund Policy:**\n"
+    "• Failed generations: Auto-refunded\n"
+    "• Technical issues: Case-by-case\n"
+    "• Payment problems: Contact support\n\n"
+    "🙏 **We're here to help make your experience amazing!**"
+)
+
+# Help callback data -> (text, keyboard)
+HELP_PAGES: Dict[str, Tuple[str, InlineKeyboardMarkup]] = {
+    "help_main": (HELP_MAIN_TEXT, HELP_MAIN_KEYBOARD),
+    "help_generate": (HELP_GENERATE_TEXT, HELP_GENERATE_KEYBOARD),
+    "help_credits": (HELP_CREDITS_TEXT, HELP_CREDITS_KEYBOARD),
+    "help_stars": (HELP_CREDITS_TEXT, HELP_CREDITS_KEYBOARD),  # Credit store's "How Stars Work"
+    "help_models": (HELP_MODELS_TEXT, HELP_MODELS_KEYBOARD),
+    "help_image": (HELP_IMAGE_TEXT, HELP_IMAGE_KEYBOARD),
+    "help_troubleshoot": (HELP_TROUBLESHOOT_TEXT, HELP_TROUBLESHOOT_KEYBOARD),
+    "help_contact": (HELP_CONTACT_TEXT, HELP_CONTACT_KEYBOARD),
+}
+
+async def help_page_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
+    """Show the help page for the pressed button"""
+    page = HELP_PAGES.get(callback.data or "")
+    if page is None:
         return
     
     try:
-        image_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🖼️ Try I2V Models", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="🤖 Model Guide", callback_data="help_models")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "🖼️ **Image Upload Guide**\n\n"
-            "📸 **Supported Formats:**\n"
-            "• JPG, JPEG, PNG, WebP, GIF\n"
-            "• Maximum size: 20MB\n"
-            "• Recommended: 1024x1024+ pixels\n\n"
-            "🎯 **Best Results:**\n"
-            "• High resolution images\n"
-            "• Clear, well-lit photos\n"
-            "• Good contrast and composition\n"
-            "• Avoid blurry or dark images\n\n"
-            "💡 **Pro Tips:**\n"
-            "• Images work best with I2V models\n"
-            "• Portrait or landscape both work\n"
-            "• Add descriptive prompts for context\n"
-            "• You can skip images for text-only\n\n"
-            "🤖 **Compatible Models:**\n"
-            "• Wan 2.2 I2V - Image to video\n"
-            "• Kling Standard - Supports images\n"
-            "• Kling Pro - Enhanced with images\n"
-            "• Kling Master I2V - Premium I2V\n"
-            "• Veo 3 - Image enhancement\n"
-            "• Runway Gen-3 - Advanced I2V\n\n"
-            "⚠️ **Note:** Image processing may add 30-60 seconds"
-        )
-        
-        await safe_edit_message(callback, help_text, reply_markup=image_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
+        text, keyboard = page
+        await safe_edit_message(callback, text, reply_markup=keyboard, parse_mode="Markdown")
+        callback_answer.cache_time = CALLBACK_ANSWER_CACHE_TIME
         
     except Exception as e:
-        logger.error(f"Error in help_image_callback: {e}")
-        await callback.answer("❌ Error loading help.")
+        logger.error(f"Error in help_page_callback: {e}")
+        callback_answer.text = "❌ Error loading help."
 
-@dp.callback_query(F.data == "help_troubleshoot")
-async def help_troubleshoot_callback(callback: CallbackQuery):
-    """Show troubleshooting help"""
-    if not callback.from_user:
-        return
-    
+async def skip_image_callback(callback: CallbackQuery, state: FSMContext, callback_answer: CallbackAnswer):
+    """Handle skip image button during generation"""
     try:
-        trouble_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Try Again", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="👤 Contact Support", callback_data="help_contact")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "🛠️ **Troubleshooting Guide**\n\n"
-            "❌ **Generation Failed?**\n"
-            "• Check your prompt clarity\n"
-            "• Try a different model\n"
-            "• Ensure stable internet\n"
-            "• Credits are auto-refunded\n\n"
-            "📸 **Image Issues?**\n"
-            "• Use supported formats (JPG, PNG)\n"
-            "• Keep under 20MB size\n"
-            "• Ensure good image quality\n"
-            "• Try skipping image if problems persist\n\n"
-            "⏱️ **Taking Too Long?**\n"
-            "• Normal time: 2-5 minutes\n"
-            "• Complex prompts take longer\n"
-            "• High-quality models need more time\n"
-            "• You'll get notified when ready\n\n"
-            "💳 **Credit Problems?**\n"
-            "• Check balance with /start\n"
-            "• Failed generations are refunded\n"
-            "• Stars payment is instant\n"
-            "• Contact support if issues persist\n\n"
-            "🔄 **General Tips:**\n"
-            "• Restart with /start\n"
-            "• Try different prompts\n"
-            "• Use simpler descriptions\n"
-            "• Contact support for persistent issues"
-        )
+        # Check if model requires image (shouldn't be able to skip)
+        user_id = callback.from_user.id
+        model = user_models.get(user_id)
+        
+        if model in IMAGE_REQUIRED_MODELS:
+            callback_answer.text = "❌ This model requires an image. Please upload one."
+            callback_answer.show_alert = True
+            return
         
-        await safe_edit_message(callback, help_text, reply_markup=trouble_keyboard, parse_mode="Markdown")
+        if isinstance(callback.message, Message):
+            # Same per-user lock as the upload path, so a skip racing a photo upload charges once
+            async with get_generation_lock(user_id):
+                data = await state.get_data()
+                if data.get('prompt'):
+                    await submit_generation(callback.message, state, user_id, get_callback_account_id(callback),
+                                            data['prompt'], None)
         
-        await callback.answer()
+        callback_answer.text = "⏭️ Skipping image upload..."
         
     except Exception as e:
-        logger.error(f"Error in help_troubleshoot_callback: {e}")
-        await callback.answer("❌ Error loading help.")
+        logger.error(f"Error in skip_image_callback: {e}")
+        callback_answer.text = "❌ Error processing skip."
 
-@dp.callback_query(F.data == "back_main")
-async def back_main_callback(callback: CallbackQuery):
+# Additional help system callbacks
+async def back_main_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Return to main menu"""
-    if not callback.from_user:
-        return
-    
     try:
         # Simulate /start command
         if callback.message:
             await cmd_start(callback.message)
-        await callback.answer("🏠 Returning to main menu...")
+        callback_answer.text = "🏠 Returning to main menu..."
         
     except Exception as e:
         logger.error(f"Error in back_main_callback: {e}")
-        await callback.answer("❌ Error returning to menu.")
+        callback_answer.text = "❌ Error returning to menu."
 
 # Credit package callbacks
-@dp.callback_query(F.data == "show_packages")
-async def show_packages_callback(callback: CallbackQuery):
+async def show_packages_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Show credit packages when Buy Credits button is clicked"""
-    await callback.answer()
-    
-    if not callback.from_user:
-        return
-        
     try:
         user_id = callback.from_user.id
         account_id = get_callback_account_id(callback)
         credits = get_credits(account_id)
         
-        # Create credit packages keyboard
-        packages_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎯 Starter: 100⭐ → 1 Credit", callback_data="buy_package_100")],
-            [InlineKeyboardButton(text="🔥 Popular: 1000⭐ → 12 Credits", callback_data="buy_package_1000")],
-            [InlineKeyboardButton(text="💎 Best Value: 2000⭐ → 25 Credits", callback_data="buy_package_2000")],
-            [InlineKeyboardButton(text="🚀 Premium: 5000⭐ → 75 Credits", callback_data="buy_package_5000")],
-            [InlineKeyboardButton(text="👑 Ultimate: 10000⭐ → 175 Credits", callback_data="buy_package_10000")],
-            [InlineKeyboardButton(text="🔙 Back to Menu", callback_data="back_to_start")]
-        ])
-        
-        package_text = (
-            "⭐ **Credit Packages - Telegram Stars**\n\n"
-            f"💳 **Current Balance:** {credits} credits\n\n"
-            "🎯 **Starter Package**\n"
-            "• 100 Stars → 1 Credit\n"
-            "• Perfect for trying out models\n\n"
-            "🔥 **Popular Choice**\n"
-            "• 1000 Stars → 12 Credits\n"
-            "• Great value for regular users\n\n"
-            "💎 **Best Value**\n"
-            "• 2000 Stars → 25 Credits\n"
-            "• More credits per star\n\n"
-            "🚀 **Premium Package**\n"
-            "• 5000 Stars → 75 Credits\n"
-            "• Excellent savings per credit\n\n"
-            "👑 **Ultimate Package**\n"
-            "• 10000 Stars → 175 Credits\n"
-            "• Maximum value for power users\n\n"
-            "✨ **All packages include:**\n"
-            "• Access to all 5 AI models\n"
-            "• Image-to-video support\n"
-            "• Instant video delivery\n"
-            "• Credits never expire\n\n"
-            "💡 Choose a package above to proceed!"
-        )
+        package_text = PACKAGES_TEXT.format(credits=credits)
         
-        try:
-            if callback.message and isinstance(callback.message, Message):
-                await callback.message.edit_text(package_text, reply_markup=packages_keyboard, parse_mode="Markdown")
-            else:
-                await bot.send_message(callback.from_user.id, package_text, reply_markup=packages_keyboard, parse_mode="Markdown")
-        except Exception:
-            # Fallback: send new message if editing fails
-            await bot.send_message(callback.from_user.id, package_text, reply_markup=packages_keyboard, parse_mode="Markdown")
+        await safe_edit_message(callback, package_text, reply_markup=PACKAGES_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in show_packages_callback: {e}")
@@ -1525,14 +1940,8 @@ async def show_packages_callback(callback: CallbackQuery):
         else:
             await bot.send_message(callback.from_user.id, "❌ Error showing packages. Please try /buy command.")
 
-@dp.callback_query(F.data.startswith("buy_package_"))
-async def buy_package_callback(callback: CallbackQuery):
+async def buy_package_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Handle credit package purchase"""
-    await callback.answer()
-    
-    if not callback.from_user:
-        return
-        
     try:
         # Extract package size from callback data
         if not callback.data:
@@ -1541,47 +1950,26 @@ async def buy_package_callback(callback: CallbackQuery):
             else:
                 await bot.send_message(callback.from_user.id, "❌ Invalid package data.")
             return
-        package_stars = int(callback.data.replace("buy_package_", ""))
+        package_stars = int(callback.data.removeprefix("buy_package_"))
         user_id = callback.from_user.id
         
-        # Package details
-        packages = {
-            100: {"credits": 1, "title": "Starter Package", "description": "1 credit for video generation"},
-            1000: {"credits": 12, "title": "Popular Package", "description": "12 credits for video generation"},
-            2000: {"credits": 25, "title": "Best Value Package", "description": "25 credits for video generation"},
-            5000: {"credits": 75, "title": "Premium Package", "description": "75 credits for video generation"},
-            10000: {"credits": 175, "title": "Ultimate Package", "description": "175 credits for video generation"}
-        }
-        
-        if package_stars not in packages:
+        if package_stars not in CREDIT_PACKAGES:
             if callback.message and hasattr(callback.message, 'answer'):
                 await callback.message.answer("❌ Invalid package selected.")
             else:
                 await bot.send_message(callback.from_user.id, "❌ Invalid package selected.")
             return
             
-        package = packages[package_stars]
+        package = CREDIT_PACKAGES[package_stars]
         
         # Get the account ID that should receive credits (group or user)
         account_id = get_callback_account_id(callback)
         
-        # Create invoice with account_id in payload
-        price = LabeledPrice(label=f"{package['credits']} Video Credits", amount=package_stars)
-        
-        await bot.send_invoice(
-            chat_id=user_id,
-            title=package["title"],
-            description=package["description"],
-            payload=f"credit_package_{package_stars}_account_{account_id}",
-            provider_token="",  # Empty for Telegram Stars (XTR)
-            currency="XTR",  # Telegram Stars
-            prices=[price],
-            need_email=False,
-            need_phone_number=False,
-            need_name=False,
-            need_shipping_address=False,
-            is_flexible=False
-        )
+        # Send the prebuilt invoice with account_id in payload
+        await bot(INVOICE_TEMPLATES[package_stars].model_copy(update={
+            "chat_id": user_id,
+            "payload": f"credit_package_{package_stars}_account_{account_id}"
+        }))
         
         # Send confirmation message
         confirm_text = (
@@ -1603,54 +1991,15 @@ async def buy_package_callback(callback: CallbackQuery):
         else:
             await bot.send_message(callback.from_user.id, f"❌ Payment error: {str(e)}\n\nPlease contact @niftysolsol for support.")
 
-@dp.callback_query(F.data == "back_to_start")
-async def back_to_start_callback(callback: CallbackQuery):
+async def back_to_start_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Return to main menu"""
-    await callback.answer()
-    
-    if not callback.from_user:
-        return
-        
     try:
-        user_id = callback.from_user.id
         account_id = get_callback_account_id(callback)
         credits = get_credits(account_id)
         
-        welcome_text = f"""
-🎬 **Welcome to AI Video Generator Bot!**
-
-👋 **Hello {callback.from_user.first_name or 'there'}!**
-
-💳 **Your Credits:** {credits} {'credit' if credits == 1 else 'credits'}
-
-🚀 **Quick Start:**
-• Use /generate to create amazing videos
-• Need credits? Try /buy for great packages
-• Get help anytime with /help
-
-🎯 **Available Models:** 7 AI models including Veo 3, Runway Gen-3, Sora 2, and Kling 2.1
-
-💰 **Pricing:** 1 credit per video, bulk discounts available
-
-✨ Ready to create something amazing?
-"""
-        
-        # Create welcome keyboard with quick actions
-        welcome_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Generate Video", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="💳 Buy Credits", callback_data="show_packages"),
-             InlineKeyboardButton(text="❓ Help & Guide", callback_data="help_main")],
-            [InlineKeyboardButton(text="📊 My Stats", callback_data="user_stats")]
-        ])
+        welcome_text = format_welcome_text(callback.from_user.first_name, credits)
         
-        try:
-            if callback.message and isinstance(callback.message, Message):
-                await callback.message.edit_text(welcome_text, reply_markup=welcome_keyboard, parse_mode="Markdown")
-            else:
-                await bot.send_message(user_id, welcome_text, reply_markup=welcome_keyboard, parse_mode="Markdown")
-        except Exception:
-            # Fallback: send new message if editing fails
-            await bot.send_message(user_id, welcome_text, reply_markup=welcome_keyboard, parse_mode="Markdown")
+        await safe_edit_message(callback, welcome_text, reply_markup=WELCOME_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in back_to_start_callback: {e}")
@@ -1659,55 +2008,12 @@ async def back_to_start_callback(callback: CallbackQuery):
         else:
             await bot.send_message(callback.from_user.id, "❌ Error returning to menu. Please use /start.")
 
-@dp.callback_query(F.data == "help_contact")
-async def help_contact_callback(callback: CallbackQuery):
-    """Show contact support information"""
-    if not callback.from_user:
-        return
-    
-    try:
-        contact_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
-            [InlineKeyboardButton(text="🔙 Help Menu", callback_data="help_main")]
-        ])
-        
-        help_text = (
-            "👤 **Contact Support**\n\n"
-            "💬 **Get Human Help:**\n"
-            "• Support: @niftysolsol\n"
-            "• Response time: 2-24 hours\n"
-            "• Response time: 2-24 hours\n\n"
-            "📝 **When Contacting Include:**\n"
-            "• Your user ID (shown in stats)\n"
-            "• Generation ID if available\n"
-            "• Description of the problem\n"
-            "• Screenshots if helpful\n\n"
-            "🚀 **Before Contacting:**\n"
-            "• Try troubleshooting guide\n"
-            "• Check your credits balance\n"
-            "• Restart with /start\n"
-            "• Try a different model\n\n"
-            "💰 **Refund Policy:**\n"
-            "• Failed generations: Auto-refunded\n"
-            "• Technical issues: Case-by-case\n"
-            "• Payment problems: Contact support\n\n"
-            "🙏 **We're here to help make your experience amazing!**"
-        )
-        
-        await safe_edit_message(callback, help_text, reply_markup=contact_keyboard, parse_mode="Markdown")
-        
-        await callback.answer()
-        
-    except Exception as e:
-        logger.error(f"Error in help_contact_callback: {e}")
-        await callback.answer("❌ Error loading contact info.")
-
 # ===== ADMIN CALLBACKS (Restricted Access) =====
-@dp.callback_query(F.data == "admin_give_credits")
-async def admin_give_credits_callback(callback: CallbackQuery):
+async def admin_give_credits_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Admin only - Give credits to users"""
-    if not callback.from_user or not is_admin(callback.from_user.id):
-        await callback.answer("❌ Access denied.", show_alert=True)
+    if not is_admin(callback.from_user.id):
+        callback_answer.text = "❌ Access denied."
+        callback_answer.show_alert = True
         return
     
     try:
@@ -1727,22 +2033,17 @@ async def admin_give_credits_callback(callback: CallbackQuery):
             "⚠️ **Admin Only** - This action is logged."
         )
         
-        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Admin Panel", callback_data="admin_back")]
-        ])
-        
-        await safe_edit_message(callback, give_credits_text, reply_markup=back_keyboard, parse_mode="Markdown")
-        await callback.answer()
+        await safe_edit_message(callback, give_credits_text, reply_markup=ADMIN_BACK_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in admin_give_credits_callback: {e}")
-        await callback.answer("❌ Admin error occurred.")
+        callback_answer.text = "❌ Admin error occurred."
 
-@dp.callback_query(F.data == "admin_view_users")
-async def admin_view_users_callback(callback: CallbackQuery):
+async def admin_view_users_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Admin only - View all users with credits"""
-    if not callback.from_user or not is_admin(callback.from_user.id):
-        await callback.answer("❌ Access denied.", show_alert=True)
+    if not is_admin(callback.from_user.id):
+        callback_answer.text = "❌ Access denied."
+        callback_answer.show_alert = True
         return
     
     try:
@@ -1772,22 +2073,17 @@ async def admin_view_users_callback(callback: CallbackQuery):
         
         users_text += f"\n\n📈 **Total Accounts:** {len(user_credits)}"
         
-        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Admin Panel", callback_data="admin_back")]
-        ])
-        
-        await safe_edit_message(callback, users_text, reply_markup=back_keyboard, parse_mode="Markdown")
-        await callback.answer()
+        await safe_edit_message(callback, users_text, reply_markup=ADMIN_BACK_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in admin_view_users_callback: {e}")
-        await callback.answer("❌ Admin error occurred.")
+        callback_answer.text = "❌ Admin error occurred."
 
-@dp.callback_query(F.data == "admin_user_lookup")
-async def admin_user_lookup_callback(callback: CallbackQuery):
+async def admin_user_lookup_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Admin only - Lookup specific user"""
-    if not callback.from_user or not is_admin(callback.from_user.id):
-        await callback.answer("❌ Access denied.", show_alert=True)
+    if not is_admin(callback.from_user.id):
+        callback_answer.text = "❌ Access denied."
+        callback_answer.show_alert = True
         return
     
     try:
@@ -1806,22 +2102,17 @@ async def admin_user_lookup_callback(callback: CallbackQuery):
             "⚠️ **Admin Only** - Lookup is logged."
         )
         
-        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Admin Panel", callback_data="admin_back")]
-        ])
-        
-        await safe_edit_message(callback, lookup_text, reply_markup=back_keyboard, parse_mode="Markdown")
-        await callback.answer()
+        await safe_edit_message(callback, lookup_text, reply_markup=ADMIN_BACK_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in admin_user_lookup_callback: {e}")
-        await callback.answer("❌ Admin error occurred.")
+        callback_answer.text = "❌ Admin error occurred."
 
-@dp.callback_query(F.data == "admin_stats")
-async def admin_stats_callback(callback: CallbackQuery):
+async def admin_stats_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Admin only - Show bot statistics"""
-    if not callback.from_user or not is_admin(callback.from_user.id):
-        await callback.answer("❌ Access denied.", show_alert=True)
+    if not is_admin(callback.from_user.id):
+        callback_answer.text = "❌ Access denied."
+        callback_answer.show_alert = True
         return
     
     try:
@@ -1846,33 +2137,21 @@ async def admin_stats_callback(callback: CallbackQuery):
         for i, (uid, credits) in enumerate(sorted_users, 1):
             stats_text += f"{i}. User `{uid}`: {credits} credits\n"
         
-        back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔙 Admin Panel", callback_data="admin_back")]
-        ])
-        
-        await safe_edit_message(callback, stats_text, reply_markup=back_keyboard, parse_mode="Markdown")
-        await callback.answer()
+        await safe_edit_message(callback, stats_text, reply_markup=ADMIN_BACK_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in admin_stats_callback: {e}")
-        await callback.answer("❌ Admin error occurred.")
+        callback_answer.text = "❌ Admin error occurred."
 
-@dp.callback_query(F.data == "admin_back")
-async def admin_back_callback(callback: CallbackQuery):
+async def admin_back_callback(callback: CallbackQuery, callback_answer: CallbackAnswer):
     """Admin only - Go back to admin panel"""
-    if not callback.from_user or not is_admin(callback.from_user.id):
-        await callback.answer("❌ Access denied.", show_alert=True)
+    if not is_admin(callback.from_user.id):
+        callback_answer.text = "❌ Access denied."
+        callback_answer.show_alert = True
         return
     
     try:
         # Recreate admin panel
-        admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💳 Give Credits", callback_data="admin_give_credits")],
-            [InlineKeyboardButton(text="📊 View All Users", callback_data="admin_view_users")],
-            [InlineKeyboardButton(text="🔍 User Lookup", callback_data="admin_user_lookup")],
-            [InlineKeyboardButton(text="📈 Bot Stats", callback_data="admin_stats")]
-        ])
-        
         admin_text = (
             "🔧 **Admin Panel**\n\n"
             f"👋 Welcome back, @niftysolsol!\n\n"
@@ -1884,14 +2163,12 @@ async def admin_back_callback(callback: CallbackQuery):
             "🔒 **Admin Only** - This panel is invisible to regular users."
         )
         
-        await safe_edit_message(callback, admin_text, reply_markup=admin_keyboard, parse_mode="Markdown")
-        await callback.answer()
+        await safe_edit_message(callback, admin_text, reply_markup=ADMIN_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in admin_back_callback: {e}")
-        await callback.answer("❌ Admin error occurred.")
+        callback_answer.text = "❌ Admin error occurred."
 
-@dp.message(GenerationStates.waiting_for_prompt)
 async def process_prompt(message: Message, state: FSMContext):
     """Handle text prompt input"""
     try:
@@ -1942,23 +2219,17 @@ async def process_prompt(message: Message, state: FSMContext):
                 if is_group:
                     track_message_for_cleanup(generation_id, generating_msg.message_id, message.chat.id, "bot")
                 
-                # Prepare generation request
-                callback_url = f"{WEBHOOK_URL.rstrip('/')}/brs_callback"
-                
                 # Use proper API call function
                 task_id = await send_to_brs_api(prompt, model, None)
                 
                 # Store generation info for callback
-                pending_generations[task_id] = {
-                    "user_id": user_id,
-                    "chat_id": message.chat.id,
-                    "account_id": account_id,
-                    "model": model,
-                    "prompt": prompt,
-                    "image_url": None,
-                    "timestamp": time.time()
-                }
-                save_pending_generations()
+                add_pending_generation(task_id, PendingGeneration(
+                    user_id=user_id,
+                    chat_id=message.chat.id,
+                    account_id=account_id,
+                    model=model,
+                    prompt=prompt
+                ))
                 
                 logger.info(f"Video generation started for user {user_id}, task_id: {task_id}")
                         
@@ -1973,15 +2244,10 @@ async def process_prompt(message: Message, state: FSMContext):
         
         # Image-to-video model - show image upload prompt
         # Check if image is required (can't skip)
-        image_required_models = ["wan_2_2_i2v", "wan_2_5", "hailuo", "kling_master_i2v", "runway_gen3", "sora_2_i2v"]
-        image_required = model in image_required_models
+        image_required = model in IMAGE_REQUIRED_MODELS
         
-        # Create keyboard - only show skip button if image is not required
-        keyboard_buttons = []
-        if not image_required:
-            keyboard_buttons.append([InlineKeyboardButton(text="⏭️ Skip Image", callback_data="skip_image")])
-        keyboard_buttons.append([InlineKeyboardButton(text="❓ Image Tips", callback_data="help_image")])
-        skip_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+        # Only show the skip button if image is not required
+        skip_keyboard = IMAGE_REQUIRED_KEYBOARD if image_required else IMAGE_OPTIONAL_KEYBOARD
         
         # Different UI for groups vs private chats
         if is_group:
@@ -2030,12 +2296,27 @@ async def process_prompt(message: Message, state: FSMContext):
         await message.answer("❌ An error occurred. Please try again later.")
         await state.clear()
 
-@dp.message(GenerationStates.waiting_for_image)
+async def update_status_message(message: Message, status, text: str, **kwargs) -> Message:
+    """Edit a status reply in place, falling back to a new reply if it can't be edited"""
+    if isinstance(status, Message):
+        try:
+            return await status.edit_text(text, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"Could not edit status message: {e}")
+    return await message.answer(text, **kwargs)
+
 async def process_image_or_skip(message: Message, state: FSMContext):
     """Handle image upload or skip"""
     if not message.from_user:
         return
-        
+    
+    # Two quick uploads for the same prompt would otherwise both pass the credit
+    # check and both charge; the second one now sees the cleared state instead
+    async with get_generation_lock(message.from_user.id):
+        await start_generation_from_state(message, state)
+
+async def start_generation_from_state(message: Message, state: FSMContext):
+    """Charge credits and submit the generation for the prompt stored in state"""
     try:
         user_id = message.from_user.id
         data = await state.get_data()
@@ -2046,8 +2327,8 @@ async def process_image_or_skip(message: Message, state: FSMContext):
             await state.clear()
             return
             
-        model = user_models.get(user_id, "veo3_fast")
         image_path = None
+        status_msg = None
         
         if message.text and message.text.lower() == "skip":
             # No image, proceed with generation
@@ -2056,20 +2337,25 @@ async def process_image_or_skip(message: Message, state: FSMContext):
             # User uploaded an image - properly download it
             try:
                 photo = message.photo[-1]  # Get the highest resolution
-                await message.answer("⏳ Downloading image...")
                 
-                # Download the image from Telegram
-                image_content = await download_telegram_file(photo.file_id)
-                if image_content:
-                    # Upload to temporary storage
-                    filename = f"{photo.file_id}.jpg"
-                    image_path = await upload_image_to_temporary_storage(image_content, filename)
-                    if image_path:
-                        await message.answer("✅ Image downloaded and processed successfully!")
-                    else:
-                        await message.answer("❌ Failed to process image. Proceeding without image.")
+                # Stream the image from Telegram straight to temporary storage while
+                # the status message goes out; the two don't depend on each other
+                status, image_path = await asyncio.gather(
+                    message.answer("⏳ Downloading image..."),
+                    stash_telegram_file(photo.file_id, f"{photo.file_id}.jpg"),
+                    return_exceptions=True
+                )
+                if isinstance(status, BaseException):
+                    logger.error(f"Could not send download status: {status}")
+                if isinstance(image_path, BaseException):
+                    logger.error(f"Error downloading image: {image_path}")
+                    image_path = None
+                # On success the status message becomes the generation progress message
+                # instead of getting its own "downloaded" edit
+                if image_path:
+                    status_msg = status
                 else:
-                    await message.answer("❌ Failed to download image. Proceeding without image.")
+                    await update_status_message(message, status, "❌ Failed to download image. Proceeding without image.")
                     
             except Exception as e:
                 logger.error(f"Error processing image: {e}")
@@ -2078,153 +2364,152 @@ async def process_image_or_skip(message: Message, state: FSMContext):
             await message.answer("❌ Please upload an image or type 'skip' to proceed.")
             return
         
-        # Deduct credits
-        account_id = get_credit_account_id(message)
-        if not deduct_credits(account_id, 1):
-            await message.answer("❌ Insufficient credits!")
-            await state.clear()
-            return
+        await submit_generation(message, state, user_id, get_credit_account_id(message), prompt, image_path,
+                                status_msg)
         
-        # Validate image requirements BEFORE deducting credits or calling API
-        # Check if this is an image-to-video model that requires an image
-        image_required_models = ["wan_2_2_i2v", "wan_2_5", "hailuo", "kling_master_i2v", "runway_gen3", "sora_2_i2v"]
-        if model in image_required_models and not image_path:
-            account_id = get_credit_account_id(message)
-            add_credits(account_id, 1)  # Refund the credit
-            await message.answer(
-                f"❌ **Image Required**\n\n"
-                f"The model '{AVAILABLE_MODELS.get(model, model)}' requires an image, "
-                f"but the image failed to upload or process.\n\n"
-                f"**Please try again:**\n"
-                f"1. Make sure you upload a valid image (JPG, PNG)\n"
-                f"2. Check your internet connection\n"
-                f"3. Try uploading a smaller image if it's very large\n\n"
-                f"💳 **Credit refunded.**",
-                parse_mode="Markdown"
-            )
-            await state.clear()
-            return
+    except Exception as e:
+        logger.error(f"Error in process_image_or_skip: {e}")
+        await message.answer("❌ An error occurred. Please try again later.")
+        await state.clear()
+
+async def submit_generation(message: Message, state: FSMContext, user_id: int, account_id: int,
+                            prompt: str, image_path: Optional[str], status_msg: Optional[Message] = None):
+    """
+    Charge credits and submit the generation; progress replies go to `message`'s chat.
+    An earlier status reply passed as `status_msg` is edited into the first of them.
+    """
+    model = user_models.get(user_id, "veo3_fast")
+    
+    # Validate image requirements BEFORE deducting credits or calling API
+    if model in IMAGE_REQUIRED_MODELS and not image_path:
+        await update_status_message(
+            message, status_msg,
+            f"❌ **Image Required**\n\n"
+            f"The model '{AVAILABLE_MODELS.get(model, model)}' requires an image, "
+            f"but the image failed to upload or process.\n\n"
+            f"**Please try again:**\n"
+            f"1. Make sure you upload a valid image (JPG, PNG)\n"
+            f"2. Check your internet connection\n"
+            f"3. Try uploading a smaller image if it's very large\n\n"
+            f"💳 **No credit was charged.**",
+            parse_mode="Markdown"
+        )
+        await state.clear()
+        return
+    
+    # Deduct credits
+    if not deduct_credits(account_id, 1):
+        await update_status_message(message, status_msg, "❌ Insufficient credits!")
+        await state.clear()
+        return
+    
+    # Send to BRS AI API with enhanced progress tracking  
+    try:
+        # Get generation ID from state
+        data = await state.get_data()
+        generation_id = data.get("generation_id", f"gen_{int(time.time() * 1000)}_{user_id}")
+        is_group = is_group_chat(message)
         
-        # Send to BRS AI API with enhanced progress tracking  
-        try:
-            # Get generation ID from state
-            data = await state.get_data()
-            generation_id = data.get("generation_id", f"gen_{int(time.time() * 1000)}_{user_id}")
-            is_group = is_group_chat(message)
-            
-            # Track user's image upload or skip message for cleanup in groups
-            if is_group:
-                track_message_for_cleanup(generation_id, message.message_id, message.chat.id, "user")
-            
-            # Simplified progress message for groups, detailed for private chats
-            if is_group:
-                progress_msg = await message.answer("🎬 **Generating...**")
-                # Track the progress message for cleanup
-                track_message_for_cleanup(generation_id, progress_msg.message_id, message.chat.id, "bot")
-            else:
-                progress_msg = await message.answer(
-                    "🎬 **Starting Video Generation**\n\n"
-                    "⏳ **Status:** Initializing request...\n"
-                f"🤖 **Model:** {AVAILABLE_MODELS[model]}\n"
-                f"📝 **Prompt:** _{prompt[:50]}{'...' if len(prompt) > 50 else ''}_\n\n"
+        # Track user's image upload or skip message for cleanup in groups
+        if is_group:
+            track_message_for_cleanup(generation_id, message.message_id, message.chat.id, "user")
+        
+        # Shared by the initial and updated progress messages
+        model_name = AVAILABLE_MODELS.get(model, model)
+        short_prompt = prompt[:50] + ("..." if len(prompt) > 50 else "")
+        
+        # Simplified progress message for groups, detailed for private chats
+        if is_group:
+            progress_msg = await update_status_message(message, status_msg, "🎬 **Generating...**")
+            # Track the progress message for cleanup
+            track_message_for_cleanup(generation_id, progress_msg.message_id, message.chat.id, "bot")
+        else:
+            progress_msg = await update_status_message(
+                message, status_msg,
+                "🎬 **Starting Video Generation**\n\n"
+                "⏳ **Status:** Initializing request...\n"
+                f"🤖 **Model:** {model_name}\n"
+                f"📝 **Prompt:** _{short_prompt}_\n\n"
                 "⏱️ **Estimated time:** 2-5 minutes\n"
                 "🔄 **Please wait while we process your request...**",
                 parse_mode="Markdown"
             )
-            
-            logger.info(f"Calling send_to_brs_api with model={model}, image_path={image_path}")
-            task_id = await send_to_brs_api(prompt, model, image_path)
-            
-            # Migrate message cleanup records from temporary generation_id to actual task_id
-            if generation_id in message_cleanup:
-                # Move cleanup data to task_id key
-                cleanup_data = message_cleanup[generation_id]
-                if task_id in message_cleanup:
-                    # Merge with existing task_id data
-                    existing_data = message_cleanup[task_id]
-                    existing_data["messages"].extend(cleanup_data.get("messages", []))
-                    logger.info(f"Merged cleanup data for {task_id}")
-                else:
-                    # Simple migration
-                    message_cleanup[task_id] = cleanup_data
-                del message_cleanup[generation_id]
-                save_message_cleanup()
-                logger.info(f"Migrated cleanup records from {generation_id} to {task_id}")
-                logger.info(f"Total messages tracked for cleanup: {len(message_cleanup[task_id].get('messages', []))}")
-            
-            # Update progress with task ID (only for private chats)
-            if not is_group:
-                try:
-                    await progress_msg.edit_text(
-                        "✅ **Video Generation Started**\n\n"
-                        f"🆔 **Generation ID:** `{task_id}`\n"
-                        f"🤖 **Model:** {AVAILABLE_MODELS[model]}\n"
-                        f"📝 **Prompt:** _{prompt[:50]}{'...' if len(prompt) > 50 else ''}_\n\n"
-                        "🎬 **Processing steps:**\n"
-                        "✅ Request submitted\n"
-                        "⏳ Analyzing prompt...\n"
-                        "⏳ Generating video...\n"
-                        "⏳ Finalizing output...\n\n"
-                        "🔔 **You'll be notified when ready!**",
-                        parse_mode="Markdown"
-                    )
-                except Exception:
-                    # If edit fails, send new message
-                    await message.answer(
-                        "✅ **Video Generation Started**\n\n"
-                        f"🆔 **Generation ID:** `{task_id}`\n"
-                        "🔔 **You'll be notified when ready!**",
-                        parse_mode="Markdown"
-                    )
-            
-            # Store pending generation with task_id
-            pending_generations[task_id] = {
-                "user_id": user_id,
-                "chat_id": message.chat.id,  # Store original chat for video delivery
-                "account_id": account_id,  # Store the account that was charged
-                "prompt": prompt,
-                "model": model,
-                "image_path": image_path
-            }
-            save_pending_generations()  # Persist generation data
-            
-            # Note: Progress message was already tracked under generation_id and migrated to task_id above
-            
-            # Final confirmation with helpful info (only for private chats)
-            if not is_group:
-                final_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📊 Check Status", callback_data="user_stats")],
-                    [InlineKeyboardButton(text="🎬 Generate Another", callback_data="quick_generate")]
-                ])
-                
+        
+        logger.info(f"Calling send_to_brs_api with model={model}, image_path={image_path}")
+        task_id = await send_to_brs_api(prompt, model, image_path)
+        
+        # Migrate message cleanup records from temporary generation_id to actual task_id
+        if generation_id in message_cleanup:
+            # Move cleanup data to task_id key
+            cleanup_data = message_cleanup[generation_id]
+            if task_id in message_cleanup:
+                # Merge with existing task_id data
+                existing_data = message_cleanup[task_id]
+                existing_data["messages"].extend(cleanup_data.get("messages", []))
+                logger.info(f"Merged cleanup data for {task_id}")
+            else:
+                # Simple migration
+                message_cleanup[task_id] = cleanup_data
+            del message_cleanup[generation_id]
+            save_message_cleanup()
+            logger.info(f"Migrated cleanup records from {generation_id} to {task_id}")
+            logger.info(f"Total messages tracked for cleanup: {len(message_cleanup[task_id].get('messages', []))}")
+        
+        # Update progress with task ID (only for private chats)
+        if not is_group:
+            try:
+                await progress_msg.edit_text(
+                    "✅ **Video Generation Started**\n\n"
+                    f"🆔 **Generation ID:** `{task_id}`\n"
+                    f"🤖 **Model:** {model_name}\n"
+                    f"📝 **Prompt:** _{short_prompt}_\n\n"
+                    + GENERATION_STEPS_TEXT,
+                    parse_mode="Markdown"
+                )
+            except Exception:
+                # If edit fails, send new message
                 await message.answer(
-                    "🎉 **Generation in Progress!**\n\n"
-                    f"🆔 **Tracking ID:** `{task_id}`\n\n"
-                    "⏰ **What happens next:**\n"
-                    "• Processing usually takes 2-5 minutes\n"
-                    "• You'll get a notification when ready\n"
-                    "• Video will be delivered directly to this chat\n\n"
-                    "🔄 **You can generate more videos while waiting!**",
-                    reply_markup=final_keyboard,
+                    "✅ **Video Generation Started**\n\n"
+                    f"🆔 **Generation ID:** `{task_id}`\n"
+                    "🔔 **You'll be notified when ready!**",
                     parse_mode="Markdown"
                 )
-            
-        except Exception as e:
-            # Refund credits on error
-            account_id = get_credit_account_id(message)
-            add_credits(account_id, 1)
-            await message.answer(f"❌ Error starting generation: {str(e)}\nCredits refunded.")
-            logger.error(f"Generation error for user {user_id}: {e}")
         
-        await state.clear()
+        # Store pending generation with task_id
+        add_pending_generation(task_id, PendingGeneration(
+            user_id=user_id,
+            chat_id=message.chat.id,
+            account_id=account_id,
+            model=model,
+            prompt=prompt,
+            image_path=image_path
+        ))
+        
+        # Note: Progress message was already tracked under generation_id and migrated to task_id above
+        
+        # Final confirmation with helpful info (only for private chats)
+        if not is_group:
+            await message.answer(
+                "🎉 **Generation in Progress!**\n\n"
+                f"🆔 **Tracking ID:** `{task_id}`\n\n"
+                "⏰ **What happens next:**\n"
+                "• Processing usually takes 2-5 minutes\n"
+                "• You'll get a notification when ready\n"
+                "• Video will be delivered directly to this chat\n\n"
+                "🔄 **You can generate more videos while waiting!**",
+                reply_markup=GENERATION_STARTED_KEYBOARD,
+                parse_mode="Markdown"
+            )
         
     except Exception as e:
-        logger.error(f"Error in process_image_or_skip: {e}")
-        await message.answer("❌ An error occurred. Please try again later.")
-        await state.clear()
+        # Refund credits on error
+        add_credits(account_id, 1)
+        await message.answer(f"❌ Error starting generation: {str(e)}\nCredits refunded.")
+        logger.error(f"Generation error for user {user_id}: {e}")
+    
+    await state.clear()
 
 # Add comprehensive help command
-@dp.message(Command("admin"))
 async def cmd_admin(message: Message):
     """Handle /admin command - Admin only"""
     if not message.from_user:
@@ -2239,13 +2524,6 @@ async def cmd_admin(message: Message):
         
     try:
         # Admin panel with credit management
-        admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="💳 Give Credits", callback_data="admin_give_credits")],
-            [InlineKeyboardButton(text="📊 View All Users", callback_data="admin_view_users")],
-            [InlineKeyboardButton(text="🔍 User Lookup", callback_data="admin_user_lookup")],
-            [InlineKeyboardButton(text="📈 Bot Stats", callback_data="admin_stats")]
-        ])
-        
         admin_text = (
             "🔧 **Admin Panel**\n\n"
             f"👋 Welcome back, @niftysolsol!\n\n"
@@ -2257,13 +2535,12 @@ async def cmd_admin(message: Message):
             "🔒 **Admin Only** - This panel is invisible to regular users."
         )
         
-        await message.answer(admin_text, reply_markup=admin_keyboard, parse_mode="Markdown")
+        await message.answer(admin_text, reply_markup=ADMIN_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in cmd_admin: {e}")
         await message.answer("❌ Admin error occurred.")
 
-@dp.message(Command("give_credits"))
 async def cmd_give_credits(message: Message):
     """Admin only - Give credits to users via command"""
     if not message.from_user or not is_admin(message.from_user.id):
@@ -2320,7 +2597,6 @@ async def cmd_give_credits(message: Message):
         logger.error(f"Error in cmd_give_credits: {e}")
         await message.answer("❌ Error giving credits. Please try again.")
 
-@dp.message(Command("lookup"))
 async def cmd_lookup(message: Message):
     """Admin only - Look up user credit balance"""
     if not message.from_user or not is_admin(message.from_user.id):
@@ -2378,46 +2654,20 @@ async def cmd_lookup(message: Message):
         logger.error(f"Error in cmd_lookup: {e}")
         await message.answer("❌ Error looking up account. Please try again.")
 
-@dp.message(Command("help"))
 async def cmd_help(message: Message):
     """Handle /help command with comprehensive help menu"""
     if not message.from_user:
         return
         
     try:
-        help_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎬 Video Generation", callback_data="help_generate")],
-            [InlineKeyboardButton(text="💳 Credits & Payment", callback_data="help_credits")],
-            [InlineKeyboardButton(text="🤖 AI Models Guide", callback_data="help_models")],
-            [InlineKeyboardButton(text="🖼️ Image Upload Tips", callback_data="help_image")],
-            [InlineKeyboardButton(text="🛠️ Troubleshooting", callback_data="help_troubleshoot")],
-            [InlineKeyboardButton(text="👤 Contact Support", callback_data="help_contact")]
-        ])
-        
-        help_text = (
-            "❓ **AI Video Bot - Complete Help Guide**\n\n"
-            f"Welcome {message.from_user.first_name or 'there'}! Choose a topic below for detailed assistance:\n\n"
-            "🎬 **Video Generation** - Step-by-step video creation\n"
-            "💳 **Credits & Payment** - Understanding the credit system\n"
-            "🤖 **AI Models** - Compare all 5 available models\n"
-            "🖼️ **Image Tips** - Optimize your image uploads\n"
-            "🛠️ **Troubleshooting** - Fix common issues\n"
-            "👤 **Contact** - Get human support\n\n"
-            "🔥 **Quick Commands:**\n"
-            "• `/generate` - Start creating videos\n"
-            "• `/buy` - Purchase credits\n"
-            "• `/reset` - Clear selection and start fresh\n"
-            "• `/start` - Return to main menu\n\n"
-            "💡 **Tip:** Use the buttons below for instant help!"
-        )
+        help_text = HELP_COMMAND_TEXT.format(name=message.from_user.first_name or 'there')
         
-        await message.answer(help_text, reply_markup=help_keyboard, parse_mode="Markdown")
+        await message.answer(help_text, reply_markup=HELP_COMMAND_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in cmd_help: {e}")
         await message.answer("❌ An error occurred. Please try again later.")
 
-@dp.message(Command("buy"))
 async def cmd_buy(message: Message):
     """Handle /buy command - Show credit packages"""
     if not message.from_user:
@@ -2428,43 +2678,9 @@ async def cmd_buy(message: Message):
         account_id = get_credit_account_id(message)
         credits = get_credits(account_id)
         
-        # Create credit packages keyboard
-        packages_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🎯 Starter: 100⭐ → 1 Credit", callback_data="buy_package_100")],
-            [InlineKeyboardButton(text="🔥 Popular: 1000⭐ → 12 Credits", callback_data="buy_package_1000")],
-            [InlineKeyboardButton(text="💎 Best Value: 2000⭐ → 25 Credits", callback_data="buy_package_2000")],
-            [InlineKeyboardButton(text="🚀 Premium: 5000⭐ → 75 Credits", callback_data="buy_package_5000")],
-            [InlineKeyboardButton(text="👑 Ultimate: 10000⭐ → 175 Credits", callback_data="buy_package_10000")],
-            [InlineKeyboardButton(text="🔙 Back to Menu", callback_data="back_to_start")]
-        ])
-        
-        package_text = (
-            "⭐ **Credit Packages - Telegram Stars**\n\n"
-            f"💳 **Current Balance:** {credits} credits\n\n"
-            "🎯 **Starter Package**\n"
-            "• 100 Stars → 1 Credit\n"
-            "• Perfect for trying out models\n\n"
-            "🔥 **Popular Choice**\n"
-            "• 1000 Stars → 12 Credits\n"
-            "• Great value for regular users\n\n"
-            "💎 **Best Value**\n"
-            "• 2000 Stars → 25 Credits\n"
-            "• More credits per star\n\n"
-            "🚀 **Premium Package**\n"
-            "• 5000 Stars → 75 Credits\n"
-            "• Excellent savings per credit\n\n"
-            "👑 **Ultimate Package**\n"
-            "• 10000 Stars → 175 Credits\n"
-            "• Maximum value for power users\n\n"
-            "✨ **All packages include:**\n"
-            "• Access to all 5 AI models\n"
-            "• Image-to-video support\n"
-            "• Instant video delivery\n"
-            "• Credits never expire\n\n"
-            "💡 Choose a package above to proceed!"
-        )
+        package_text = PACKAGES_TEXT.format(credits=credits)
         
-        await message.answer(package_text, reply_markup=packages_keyboard, parse_mode="Markdown")
+        await message.answer(package_text, reply_markup=PACKAGES_KEYBOARD, parse_mode="Markdown")
         
     except Exception as e:
         logger.error(f"Error in cmd_buy: {e}")
@@ -2479,7 +2695,6 @@ async def process_pre_checkout(pre_checkout_query: PreCheckoutQuery):
     except Exception as e:
         logger.error(f"Error in process_pre_checkout: {e}")
 
-@dp.message(F.content_type == ContentType.SUCCESSFUL_PAYMENT)
 async def process_successful_payment(message: Message):
     """Handle successful payment"""
     if not message.from_user or not message.successful_payment:
@@ -2492,27 +2707,13 @@ async def process_successful_payment(message: Message):
         
         # Parse package from payload
         if payload.startswith("credit_package_"):
-            # Extract package_stars and account_id from payload
-            payload_parts = payload.split("_")
-            package_stars = int(payload_parts[2])  # credit_package_XXX_account_YYY
+            # credit_package_XXX_account_YYY (legacy payloads stop after XXX and credit the payer)
+            stars_str, _, account_str = payload.removeprefix("credit_package_").partition("_account_")
+            package_stars = int(stars_str)
+            account_id = int(account_str) if account_str else user_id
             
-            # Check if account_id is included in payload (new format)
-            if len(payload_parts) >= 5 and payload_parts[3] == "account":
-                account_id = int(payload_parts[4])
-            else:
-                # Legacy format - use user_id
-                account_id = user_id
-            
-            # Credit mapping
-            credit_packages = {
-                100: 1,
-                1000: 12,
-                2000: 25,
-                5000: 75,
-                10000: 175
-            }
-            
-            credits_to_add = credit_packages.get(package_stars, 0)
+            package = CREDIT_PACKAGES.get(package_stars)
+            credits_to_add = package["credits"] if package else 0
             if credits_to_add > 0:
                 # Add credits to the correct account (group or user)
                 add_credits(account_id, credits_to_add)
@@ -2552,15 +2753,21 @@ async def process_successful_payment(message: Message):
             logger.error("Payment error but no user found in message")
 
 # aiohttp web handlers
+def brs_json_response(payload: dict, status: int = 200) -> web.Response:
+    """JSON reply for BRS AI, encoded with msgspec instead of json.dumps"""
+    return web.Response(body=brs_request_encoder.encode(payload), status=status, content_type="application/json")
+
 async def brs_callback(request):
     """Handle BRS AI API callbacks with HMAC authentication"""
     try:
-        # Get request body and headers for debugging
         body = await request.read()
-        headers = dict(request.headers)
         
-        # Log all headers to debug signature format
-        logger.info(f"Callback headers: {headers}")
+        # Full headers and payloads are only built when debug logging is on; this
+        # endpoint is hit once per finished generation
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            # Log all headers to debug signature format
+            logger.debug(f"Callback headers: {dict(request.headers)}")
         
         # Try multiple possible signature header formats
         signature = (
@@ -2571,7 +2778,8 @@ async def brs_callback(request):
             request.headers.get('Signature', '')
         )
         
-        logger.info(f"Found signature: {signature}")
+        if debug_enabled:
+            logger.debug(f"Found signature: {signature}")
         
         # TEMPORARY: Disable signature verification since BRS AI doesn't send signatures
         # TODO: Contact BRS AI about signature implementation or implement IP whitelist
@@ -2580,90 +2788,114 @@ async def brs_callback(request):
         if not disable_verification:
             if not signature:
                 logger.error("Missing callback signature - potential attack attempt")
-                return web.json_response({"error": "Missing signature"}, status=403)
+                return brs_json_response({"error": "Missing signature"}, status=403)
             
             if not verify_callback_signature(body, signature):
                 logger.error(f"Invalid callback signature from IP {request.remote} - security breach attempt")
                 logger.error(f"Expected signature verification failed for body length: {len(body)}")
                 # Log additional security details without exposing sensitive info
                 logger.error(f"Signature format received: {signature[:10]}...{signature[-10:] if len(signature) > 20 else ''}")
-                return web.json_response({"error": "Invalid signature"}, status=403)
+                return brs_json_response({"error": "Invalid signature"}, status=403)
             else:
                 logger.info("Callback signature verification successful")
         else:
             logger.warning("SECURITY WARNING: Signature verification disabled for debugging - NOT FOR PRODUCTION!")
         
-        # Parse JSON data
+        # Decode straight into the typed payload
         try:
-            data = json.loads(body.decode('utf-8'))
-        except json.JSONDecodeError as e:
+            payload = brs_callback_decoder.decode(body)
+        except msgspec.ValidationError as e:
+            logger.error(f"Unexpected callback payload shape: {e}")
+            return brs_json_response({"error": "Invalid payload"}, status=400)
+        except msgspec.DecodeError as e:
             logger.error(f"Invalid JSON in callback: {e}")
-            return web.json_response({"error": "Invalid JSON"}, status=400)
+            return brs_json_response({"error": "Invalid JSON"}, status=400)
         
         # Enhanced debugging for callback processing
-        logger.info(f"=== Processing BRS AI Callback ===")
-        logger.info(f"Parsed JSON data: {json.dumps(data, indent=2)}")
+        if debug_enabled:
+            logger.debug(f"Parsed callback payload: {payload}")
         
-        # BRS AI callback format: {"code": 200, "msg": "success", "data": {"taskId": "...", "info": {"resultUrls": "[\"url1\"]"}}}
-        code = data.get('code')
-        msg = data.get('msg', '')
-        task_data = data.get('data', {})
-        generation_id = task_data.get('taskId') or task_data.get('task_id')
+        code = payload.code
+        msg = payload.msg or ''
+        task_data = payload.data or BrsCallbackData()
+        generation_id = task_data.task_id or task_data.task_id_snake
         
         logger.info(f"Callback details - Code: {code}, Message: {msg}, TaskId: {generation_id}")
         
         if not generation_id:
             logger.warning("❌ No taskId in callback - rejecting")
-            return web.json_response({"error": "Missing taskId"}, status=400)
-        
-        logger.info(f"Current pending generations: {list(pending_generations.keys())}")
-        
-        if generation_id not in pending_generations:
-            logger.warning(f"❌ Unknown generation_id: {generation_id}")
-            logger.info(f"Available pending IDs: {list(pending_generations.keys())}")
-            return web.json_response({"error": "Unknown generation_id"}, status=400)
+            return brs_json_response({"error": "Missing taskId"}, status=400)
+        
+        generation_info = pending_generations.get(generation_id)
+        if generation_info is None:
+            logger.warning(f"❌ Unknown generation_id: {generation_id} ({len(pending_generations)} pending)")
+            return brs_json_response({"error": "Unknown generation_id"}, status=400)
+        
+        # Claim the generation before acknowledging, so a retried or duplicate callback
+        # can't deliver or refund twice. The record itself stays in the pending table
+        # (and on disk) until process_brs_result has delivered or refunded it
+        if generation_id in claimed_generations:
+            logger.info(f"Duplicate callback for {generation_id}, already being processed")
+            return brs_json_response({"status": "ok"})
+        claimed_generations.add(generation_id)
+        
+        logger.info(f"✅ Found generation for user {generation_info.user_id}")
+        
+        # Ack BRS AI right away; downloading and uploading the video can take minutes,
+        # and a slow response would only invite retries
+        spawn_background(
+            process_brs_result(generation_id, generation_info, code, msg, task_data),
+            name=f"brs_result_{generation_id}"
+        )
         
-        generation_info = pending_generations[generation_id]
-        user_id = generation_info['user_id']
-        logger.info(f"✅ Found generation for user {user_id}")
+        return brs_json_response({"status": "ok"})
         
+    except Exception as e:
+        logger.error(f"Error processing callback: {e}")
+        return brs_json_response({"error": "Internal server error"}, status=500)
+
+async def process_brs_result(generation_id: str, generation_info: PendingGeneration, code: Optional[int],
+                             msg: str, task_data: BrsCallbackData):
+    """Deliver or refund a finished generation after its callback has been acknowledged"""
+    user_id = generation_info.user_id
+    keep_pending = False
+    try:
         if code == 200:
             # Success - extract video URLs from resultUrls JSON string
             logger.info("✅ Generation successful - processing video URLs")
-            info = task_data.get('info', {})
-            result_urls_str = info.get('resultUrls', info.get('result_urls', []))
+            info = task_data.info or BrsCallbackInfo()
+            result_urls_str = info.result_urls if info.result_urls is not None else (info.result_urls_snake or [])
             
             # Check for Runway format (video_url directly in task_data)
-            if not result_urls_str and 'video_url' in task_data:
-                result_urls_str = [task_data['video_url']]
+            if not result_urls_str and task_data.video_url is not None:
+                result_urls_str = [task_data.video_url]
                 logger.info(f"Found Runway format video_url: {result_urls_str}")
             
             # Check for Wan2.2 format (resultJson) if no URLs found in info
-            if not result_urls_str and 'resultJson' in task_data:
+            if not result_urls_str and task_data.result_json is not None:
                 try:
-                    result_json = json.loads(task_data['resultJson'])
-                    result_urls_str = result_json.get('resultUrls', [])
+                    result_urls_str = brs_result_json_decoder.decode(task_data.result_json).result_urls
                     logger.info(f"Found Wan2.2 format URLs: {result_urls_str}")
-                except json.JSONDecodeError as e:
+                except msgspec.DecodeError as e:
                     logger.error(f"Failed to parse Wan2.2 resultJson: {e}")
             
-            logger.info(f"Info object: {info}")
-            logger.info(f"Result URLs string: {result_urls_str}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Info object: {info}")
+                logger.debug(f"Result URLs string: {result_urls_str}")
             
             try:
                 # Handle both JSON string and list formats from BRS AI
                 if isinstance(result_urls_str, list):
                     result_urls = result_urls_str  # Already a list
-                    logger.info(f"Result URLs received as list: {result_urls}")
+                    logger.debug("Result URLs received as list: %s", result_urls)
                 else:
-                    result_urls = json.loads(result_urls_str)  # Parse JSON string
-                    logger.info(f"Parsed result URLs from JSON: {result_urls}")
+                    result_urls = brs_result_urls_decoder.decode(result_urls_str)  # Parse JSON string
+                    logger.debug("Parsed result URLs from JSON: %s", result_urls)
                 
                 if result_urls and len(result_urls) > 0:
                     video_url = result_urls[0]  # Use first video URL
-                    # Get original chat_id from pending generation
-                    gen_data = pending_generations.get(generation_id, {})
-                    original_chat_id = gen_data.get("chat_id", user_id)  # Fallback to user_id
+                    # Deliver to the chat the generation was started from
+                    original_chat_id = generation_info.chat_id
                     logger.info(f"🎬 Sending video to chat {original_chat_id} (user {user_id}): {video_url}")
                     await send_video_to_chat(original_chat_id, video_url, generation_id)
                     
@@ -2675,84 +2907,93 @@ async def brs_callback(request):
                 else:
                     logger.error("❌ No video URLs in successful callback")
                     # For failure refunds, use the original generation's account type
-                    gen_data = pending_generations.get(generation_id, {})
-                    original_account_id = gen_data.get("account_id", user_id)
-                    original_chat_id = gen_data.get("chat_id", user_id)
+                    original_account_id = generation_info.account_id
+                    original_chat_id = generation_info.chat_id
                     add_credits(original_account_id, 1)
                     await send_failure_message(original_chat_id, generation_id)
-            except (json.JSONDecodeError, IndexError, TypeError) as e:
+            except (msgspec.DecodeError, IndexError, TypeError) as e:
                 logger.error(f"❌ Error parsing resultUrls: {e}")
                 logger.error(f"Raw resultUrls data: {result_urls_str} (type: {type(result_urls_str)})")
                 # For failure refunds, use the original generation's account type
-                gen_data = pending_generations.get(generation_id, {})
-                original_account_id = gen_data.get("account_id", user_id)
+                original_account_id = generation_info.account_id
                 add_credits(original_account_id, 1)
                 await send_failure_message(user_id, generation_id)
         else:
             # Failure - refund credits
             logger.info(f"Video generation failed: {msg}")
             # For failure refunds, use the original generation's account type
-            gen_data = pending_generations.get(generation_id, {})
-            original_account_id = gen_data.get("account_id", user_id)
+            original_account_id = generation_info.account_id
             add_credits(original_account_id, 1)
             await send_failure_message(user_id, generation_id)
-        
-        # Clean up
-        if generation_id in pending_generations:
-            # Clean up temporary image file if it exists
-            image_path = generation_info.get('image_path')
-            if image_path and os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                    logger.info(f"Cleaned up temporary image file: {image_path}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up image file {image_path}: {e}")
-            
-            del pending_generations[generation_id]
-            save_pending_generations()  # Persist cleanup
-        
-        return web.json_response({"status": "ok"})
-        
+    except asyncio.CancelledError:
+        # Shut down before delivering or refunding: the record stays on disk
+        keep_pending = True
+        raise
     except Exception as e:
-        logger.error(f"Error processing callback: {e}")
-        return web.json_response({"error": "Internal server error"}, status=500)
+        logger.error(f"Error processing result for generation {generation_id}: {e}")
+    finally:
+        # Delivered or refunded: only now may the record leave the pending table
+        if not keep_pending:
+            remove_pending_generation(generation_id)
+        claimed_generations.discard(generation_id)
+        
+        # Clean up temporary image file if it exists
+        image_path = generation_info.image_path
+        if image_path:
+            try:
+                await aiofiles.os.remove(image_path)
+                logger.info(f"Cleaned up temporary image file: {image_path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error cleaning up image file {image_path}: {e}")
 
 async def send_video_to_chat(chat_id: int, video_url: str, generation_id: str):
     """Send completed video to chat (user or group) using aiohttp"""
+    video_path = None
+    video_msg = None
     try:
-        global http_session
-        if not http_session:
-            http_session = ClientSession()
+        # Let Telegram fetch the video from the CDN itself so the bytes never pass
+        # through this server; it refuses URLs over its 20MB limit or it can't reach
+        try:
+            video_msg = await bot.send_video(
+                chat_id=chat_id,
+                video=video_url,
+                caption="🎬 Your video is ready!"
+            )
+        except TelegramBadRequest as e:
+            logger.info(f"Telegram could not fetch video by URL, uploading it instead: {e}")
+        
+        if video_msg is None:
+            # Stream the video to disk and let aiogram upload it from there; a burst of
+            # completions shares a bounded number of download/upload slots
+            video_filename = f"video_{generation_id}.mp4"
+            async with video_delivery_semaphore:
+                video_path = await download_to_temp_file(video_url, video_filename)
+                if video_path:
+                    video_msg = await bot.send_video(
+                        chat_id=chat_id,
+                        video=FSInputFile(video_path, filename=video_filename),
+                        caption="🎬 Your video is ready!"
+                    )
+        
+        if video_msg:
+            logger.info(f"Successfully sent video to chat {chat_id}")
+            
+            # Clean up all intermediate messages in groups, keep only the final video
+            await cleanup_generation_messages(generation_id, keep_final_message_id=video_msg.message_id)
+            
+        else:
+            # If download fails, send the URL instead
+            fallback_msg = await bot.send_message(
+                chat_id=chat_id,
+                text=f"✅ Video generated successfully!\nDownload: {video_url}"
+            )
+            logger.warning(f"Could not download video from {video_url}, sent URL instead")
+            
+            # Clean up all intermediate messages in groups, keep only the final message
+            await cleanup_generation_messages(generation_id, keep_final_message_id=fallback_msg.message_id)
             
-        # Download video using aiohttp
-        async with http_session.get(video_url) as response:
-            if response.status == 200:
-                video_content = await response.read()
-                
-                # Create video file for sending
-                video_file = BufferedInputFile(video_content, filename=f"video_{generation_id}.mp4")
-                
-                video_msg = await bot.send_video(
-                    chat_id=chat_id,
-                    video=video_file,
-                    caption="🎬 Your video is ready!"
-                )
-                logger.info(f"Successfully sent video to chat {chat_id}")
-                
-                # Clean up all intermediate messages in groups, keep only the final video
-                await cleanup_generation_messages(generation_id, keep_final_message_id=video_msg.message_id)
-                
-            else:
-                # If download fails, send the URL instead
-                fallback_msg = await bot.send_message(
-                    chat_id=chat_id,
-                    text=f"✅ Video generated successfully!\nDownload: {video_url}"
-                )
-                logger.warning(f"Could not download video from {video_url}, sent URL instead")
-                
-                # Clean up all intermediate messages in groups, keep only the final message
-                await cleanup_generation_messages(generation_id, keep_final_message_id=fallback_msg.message_id)
-                
     except Exception as e:
         logger.error(f"Error sending video to chat {chat_id}: {e}")
         try:
@@ -2766,16 +3007,13 @@ async def send_video_to_chat(chat_id: int, video_url: str, generation_id: str):
             logger.error(f"Error sending fallback message to chat {chat_id}: {send_error}")
             # Clean up all intermediate messages even if fallback fails
             await cleanup_generation_messages(generation_id)
+    finally:
+        if video_path:
+            remove_temp_file(video_path)
 
 async def send_failure_message(chat_id: int, generation_id: str):
     """Send enhanced failure message to chat (user or group)"""
     try:
-        retry_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔄 Try Again", callback_data="quick_generate")],
-            [InlineKeyboardButton(text="💡 Get Help", callback_data="help_troubleshoot"),
-             InlineKeyboardButton(text="💳 Check Credits", callback_data="user_stats")]
-        ])
-        
         failure_msg = await bot.send_message(
             chat_id=chat_id,
             text=(
@@ -2790,7 +3028,7 @@ async def send_failure_message(chat_id: int, generation_id: str):
                 "📞 **Support:** @niftysolsol\n\n"
                 "👆 **Quick actions below:**"
             ),
-            reply_markup=retry_keyboard,
+            reply_markup=RETRY_KEYBOARD,
             parse_mode="Markdown"
         )
         logger.info(f"Sent enhanced failure message to chat {chat_id}")
@@ -2803,17 +3041,21 @@ async def send_failure_message(chat_id: int, generation_id: str):
         # Clean up intermediate messages even if failure message fails
         await cleanup_generation_messages(generation_id)
 
+# Health probe body, encoded once. A Response object can only be sent once, so the
+# bytes are shared rather than the response itself
+HEALTH_OK_BODY = b"OK"
+
 async def health_check(request):
     """Primary health check handler for Cloud Run deployment"""
-    return web.Response(text="OK", status=200, content_type="text/plain")
+    return web.Response(body=HEALTH_OK_BODY, status=200, content_type="text/plain")
 
 async def index_handler(request):
     """Root endpoint handler - same as health check"""
-    return web.Response(text="OK", status=200, content_type="text/plain")
+    return web.Response(body=HEALTH_OK_BODY, status=200, content_type="text/plain")
 
 async def health_handler(request):
     """Secondary health check endpoint"""
-    return web.Response(text="OK", status=200, content_type="text/plain")
+    return web.Response(body=HEALTH_OK_BODY, status=200, content_type="text/plain")
 
 async def serve_image(request):
     """Serve uploaded images for BRS AI to access with security hardening"""
@@ -2827,8 +3069,8 @@ async def serve_image(request):
             return web.Response(text="Access denied", status=403)
         
         # SECURITY: Only allow specific file extensions and validate filename
-        allowed_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
-        if not secure_filename.lower().endswith(allowed_extensions):
+        content_type = IMAGE_CONTENT_TYPES.get(os.path.splitext(secure_filename.lower())[1])
+        if content_type is None:
             return web.Response(text="Invalid file type", status=400)
             
         # SECURITY: Additional filename validation
@@ -2836,41 +3078,29 @@ async def serve_image(request):
             logger.warning(f"Suspicious filename blocked: {secure_filename}")
             return web.Response(text="Invalid filename", status=400)
         
-        # SECURITY: Only serve from controlled directory
-        CONTROLLED_IMAGE_DIR = tempfile.gettempdir()
-        image_path = os.path.join(CONTROLLED_IMAGE_DIR, secure_filename)
-        
-        # SECURITY: Ensure the resolved path is still in the controlled directory
-        if not os.path.commonpath([CONTROLLED_IMAGE_DIR, os.path.dirname(image_path)]) == CONTROLLED_IMAGE_DIR:
+        # SECURITY: Only serve from controlled directory. The name is a bare basename with
+        # no separators or "..", so joining can't leave IMAGE_DIR; the string compare below
+        # is a cheap belt-and-braces check in place of normalising both paths
+        image_path = os.path.join(IMAGE_DIR, secure_filename)
+        if os.path.dirname(image_path) != IMAGE_DIR:
             logger.warning(f"Path traversal attempt blocked: {image_path}")
             return web.Response(text="Access denied", status=403)
-            
-        if not os.path.exists(image_path):
-            return web.Response(text="Image not found", status=404)
         
         # SECURITY: Check file size before reading (max 50MB)
+        # (filesystem calls go through aiofiles.os so a slow disk can't stall the loop)
         try:
-            file_stat = os.stat(image_path)
+            file_stat = await aiofiles.os.stat(image_path)
             file_size = file_stat.st_size
             MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB limit
             
             if file_size > MAX_FILE_SIZE:
                 logger.warning(f"Large file access blocked: {secure_filename} ({file_size} bytes)")
                 return web.Response(text="File too large", status=413)
-                
-            # SECURITY: Check file age for TTL cleanup (delete files older than 24 hours)
-            import time
-            file_age = time.time() - file_stat.st_mtime
-            TTL_SECONDS = 24 * 60 * 60  # 24 hours
-            
-            if file_age > TTL_SECONDS:
-                logger.info(f"Removing expired image file: {secure_filename}")
-                try:
-                    os.remove(image_path)
-                except OSError:
-                    pass
-                return web.Response(text="Image expired", status=404)
-                
+
+            # Expiry is left to image_sweeper, which removes old files in bulk
+
+        except FileNotFoundError:
+            return web.Response(text="Image not found", status=404)
         except OSError as e:
             logger.error(f"Error checking file stats for {secure_filename}: {e}")
             return web.Response(text="File access error", status=500)
@@ -2880,56 +3110,84 @@ async def serve_image(request):
             logger.warning(f"Unauthorized file access attempt: {secure_filename}")
             return web.Response(text="Access denied", status=403)
             
-        # Serve the image file with size limit reading
-        try:
-            with open(image_path, 'rb') as f:
-                image_data = f.read(MAX_FILE_SIZE)  # Limit read size as additional safety
-                
-        except IOError as e:
-            logger.error(f"Error reading image file {secure_filename}: {e}")
-            return web.Response(text="File read error", status=500)
-            
-        # Determine content type with proper mapping
-        content_type = 'application/octet-stream'  # Safe default
-        file_ext = secure_filename.lower().split('.')[-1]
-        content_type_map = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg', 
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp'
-        }
-        content_type = content_type_map.get(file_ext, 'application/octet-stream')
-        
         # SECURITY: Add security headers
         security_headers = {
+            'Content-Type': content_type,
             'Cache-Control': 'public, max-age=3600',  # Cache for 1 hour
             'X-Content-Type-Options': 'nosniff',      # Prevent MIME sniffing
             'X-Frame-Options': 'DENY',                # Prevent embedding
             'Content-Security-Policy': "default-src 'none'",  # Strict CSP
             'X-Robots-Tag': 'noindex, nofollow',      # Prevent indexing
-            'Content-Length': str(len(image_data))    # Explicit content length
         }
-            
-        return web.Response(
-            body=image_data,
-            content_type=content_type,
-            headers=security_headers
-        )
+        
+        # Stream from the page cache with sendfile instead of reading the image into
+        # memory; FileResponse sets Content-Length from the file itself
+        return web.FileResponse(image_path, chunk_size=64 * 1024, headers=security_headers)
         
     except Exception as e:
         logger.error(f"Error serving image: {e}")
         return web.Response(text="Internal server error", status=500)
 
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-run
+background_tasks: set = set()
+
+def _on_background_task_done(task: asyncio.Task):
+    """Drop the finished task and surface any exception it raised"""
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background task {task.get_name()} failed: {task.exception()}")
+
+def spawn_background(coro, name: Optional[str] = None) -> asyncio.Task:
+    """Run a coroutine in the background without blocking the current request"""
+    task = asyncio.create_task(coro, name=name)
+    background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+# Updates from one user in one chat are fed in arrival order, so a photo can't overtake the
+# prompt that moved the FSM to waiting_for_image; other users and chats still run concurrently
+update_locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def update_order_key(update: Update) -> Optional[Tuple[int, int]]:
+    """Return the (chat_id, user_id) an update must be ordered within, if any"""
+    if update.message and update.message.from_user:
+        return update.message.chat.id, update.message.from_user.id
+    if update.callback_query:
+        callback = update.callback_query
+        chat_id = callback.message.chat.id if callback.message else callback.from_user.id
+        return chat_id, callback.from_user.id
+    return None
+
+async def feed_update_in_order(update: Update):
+    """Feed an update to the dispatcher after earlier updates from the same user and chat"""
+    key = update_order_key(update)
+    if key is None:
+        await dp.feed_update(bot=bot, update=update)
+        return
+    
+    lock = update_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        update_locks[key] = lock
+    async with lock:
+        await dp.feed_update(bot=bot, update=update)
+
 async def webhook_handler(request):
     """Handle incoming Telegram webhook updates"""
+    # Reject anything that didn't come from Telegram before touching the body
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(secret.encode('utf-8', 'surrogateescape'), TELEGRAM_WEBHOOK_SECRET_BYTES):
+        logger.warning(f"Rejected webhook request with bad secret token from {request.remote}")
+        return web.Response(text="Forbidden", status=403)
+    
     try:
-        # Get the raw JSON data
-        update_data = await request.json()
+        # Validate straight from the raw body; pydantic parses the JSON itself, so there
+        # is no intermediate dict
+        telegram_update = Update.model_validate_json(await request.read(), context={"bot": bot})
         
-        # Process the update through aiogram dispatcher
-        telegram_update = Update(**update_data)
-        await dp.feed_update(bot=bot, update=telegram_update)
+        # Ack Telegram right away and let the dispatcher handle the update on the loop;
+        # slow handlers (image downloads, BRS submits) no longer hold the webhook open
+        spawn_background(feed_update_in_order(telegram_update), name=f"update_{telegram_update.update_id}")
         
         return web.Response(text="OK", status=200)
         
@@ -2942,12 +3200,18 @@ async def setup_webhook(app):
     try:
         # Initialize HTTP session first
         await init_http_session()
+        start_credits_flusher()
+        start_pending_flusher()
+        start_image_sweeper()
+        start_pending_sweeper()
         
         # Set webhook URL with Telegram (clean up any double slashes)
         webhook_url = f"{WEBHOOK_URL.rstrip('/')}/webhook"
         await bot.set_webhook(
             url=webhook_url,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
             drop_pending_updates=True,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
             allowed_updates=["message", "callback_query", "pre_checkout_query"]
         )
         logger.info(f"✅ Webhook set successfully: {webhook_url}")
@@ -2962,8 +3226,18 @@ async def cleanup_webhook(app):
         await bot.delete_webhook()
         logger.info("Webhook deleted")
         
+        # Let in-flight updates finish before their HTTP session goes away
+        if background_tasks:
+            await asyncio.wait(list(background_tasks), timeout=10)
+        
+        if image_sweeper_task:
+            image_sweeper_task.cancel()
+        if pending_sweeper_task:
+            pending_sweeper_task.cancel()
+        
         # Cleanup HTTP session
         await cleanup_http_session()
+        await dp.storage.close()
         logger.info("Webhook cleanup completed")
         
     except Exception as e:
@@ -2976,6 +3250,8 @@ async def create_web_app():
     # Add startup and cleanup hooks for webhook mode
     app.on_startup.append(setup_webhook)
     app.on_cleanup.append(cleanup_webhook)
+    app.on_cleanup.append(stop_credits_flusher)  # After in-flight updates have finished
+    app.on_cleanup.append(stop_pending_flusher)
     
     # Add routes with explicit error handling
     try:
@@ -3003,10 +3279,27 @@ async def create_web_app():
     
     return app
 
+def create_http_session() -> ClientSession:
+    """Build the pooled session shared by Telegram file downloads and BRS AI calls"""
+    connector = TCPConnector(
+        limit=200,
+        limit_per_host=50,
+        ttl_dns_cache=300,  # Don't resolve api.telegram.org / api.kie.ai on every request
+        keepalive_timeout=75
+    )
+    return ClientSession(connector=connector, timeout=HTTP_TIMEOUT)
+
+def get_http_session() -> ClientSession:
+    """Return the shared HTTP session, creating it if startup hasn't run yet"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = create_http_session()
+    return http_session
+
 async def init_http_session():
     """Initialize global HTTP session"""
     global http_session
-    http_session = ClientSession()
+    http_session = create_http_session()
     logger.info("HTTP session initialized")
 
 async def cleanup_http_session():
@@ -3038,16 +3331,21 @@ def main():
         port = int(os.getenv("PORT", 5000))
         
         logger.info(f"🚀 Starting BRS Telegram Bot server on port {port}")
-        logger.info(f"📡 Callback URL: {WEBHOOK_URL.rstrip('/')}/brs_callback")
+        logger.info(f"📡 Callback URL: {BRS_CALLBACK_URL}")
         logger.info(f"🤖 Bot Token: {BOT_TOKEN[:20]}...")
         
-        # Create web app with startup/cleanup hooks
-        app = asyncio.run(create_web_app())
-        
-        logger.info("✅ Web application created successfully")
+        # uvloop is optional (it doesn't build on Windows); run_app creates its loop from
+        # the policy, so it has to be installed before that
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logger.info("⚡ Using uvloop event loop")
+        except ImportError:
+            logger.info("uvloop not installed, using the default asyncio event loop")
         
-        # Run the web application - this will trigger startup hooks
-        web.run_app(app, host='0.0.0.0', port=port, access_log=None)
+        # Build and serve the web app on the same event loop: run_app awaits the
+        # coroutine itself, then triggers the startup hooks
+        web.run_app(create_web_app(), host='0.0.0.0', port=port, access_log=None)
         
     except ValueError as e:
         logger.error(f"❌ Environment validation failed: {e}")
@@ -3059,12 +3357,8 @@ def main():
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise
 
-@dp.callback_query(F.data == "reset_model")
-async def reset_model_selection(callback: CallbackQuery, state: FSMContext):
+async def reset_model_selection(callback: CallbackQuery, state: FSMContext, callback_answer: CallbackAnswer):
     """Handle model selection reset"""
-    if not callback.from_user:
-        return
-        
     try:
         user_id = callback.from_user.id
         
@@ -3078,26 +3372,87 @@ async def reset_model_selection(callback: CallbackQuery, state: FSMContext):
         
         account_id = get_callback_account_id(callback)
         credits = get_credits(account_id)
-        keyboard = create_model_selection_keyboard()
-        
         await safe_edit_message(
             callback,
-            "🔄 **Model Selection Reset**\n\n"
-            f"💳 **Your Balance:** `{credits}` credits\n\n"
-            "🤖 **Choose Your AI Model:**\n\n"
-            "⚡ **Fast:** Quick generation (1-2 min)\n"
-            "🎵 **Audio:** High quality with sound\n"
-            "🚀 **Advanced:** Premium features\n"
-            "💰 **Affordable:** Budget-friendly options\n\n"
-            "👆 **Select a model to get started:**",
-            keyboard,
+            RESET_MODEL_TEXT.format(credits=credits),
+            MODEL_SELECTION_KEYBOARD,
             "Markdown"
         )
-        await callback.answer("🔄 Model selection reset!")
+        callback_answer.text = "🔄 Model selection reset!"
         
     except Exception as e:
         logger.error(f"Error in reset_model_selection: {e}")
-        await callback.answer("❌ Error resetting model selection.")
+        callback_answer.text = "❌ Error resetting model selection."
+
+# Every callback goes through one handler instead of aiogram testing a separate
+# F.data filter per handler on each click. Fixed button data is looked up here first.
+# Callback data -> (handler, whether it takes the FSM state)
+CALLBACK_ROUTES: Dict[str, Tuple[Callable[..., Awaitable[None]], bool]] = {
+    "quick_generate": (quick_generate_callback, True),
+    "buy_credits": (buy_credits_callback, False),
+    "buy_1": (buy_one_credit_callback, False),
+    "user_stats": (user_stats_callback, False),
+    "skip_image": (skip_image_callback, True),
+    "back_main": (back_main_callback, False),
+    "show_packages": (show_packages_callback, False),
+    "back_to_start": (back_to_start_callback, False),
+    "admin_give_credits": (admin_give_credits_callback, False),
+    "admin_view_users": (admin_view_users_callback, False),
+    "admin_user_lookup": (admin_user_lookup_callback, False),
+    "admin_stats": (admin_stats_callback, False),
+    "admin_back": (admin_back_callback, False),
+    "reset_model": (reset_model_selection, True),
+    "buy_packages": (show_packages_callback, False),
+}
+
+# Callbacks whose data carries an argument after a fixed prefix ("model_veo3_fast",
+# "buy_package_100", "help_models") are routed on the text before the first "_".
+# First segment -> (full prefix, handler, whether it takes the FSM state)
+CALLBACK_PREFIX_ROUTES: Dict[str, Tuple[str, Callable[..., Awaitable[None]], bool]] = {
+    "model": ("model_", process_model_selection, True),
+    "buy": ("buy_package_", buy_package_callback, False),
+    "help": ("help_", help_page_callback, False),
+}
+
+@dp.callback_query()
+async def dispatch_callback(callback: CallbackQuery, state: FSMContext, callback_answer: CallbackAnswer):
+    """Route callback data to its handler with at most two dict lookups"""
+    data = callback.data or ""
+    route = CALLBACK_ROUTES.get(data)
+    if route is None:
+        prefixed = CALLBACK_PREFIX_ROUTES.get(data.partition("_")[0])
+        if prefixed is None or not data.startswith(prefixed[0]):
+            # Unknown or stale button - the middleware's answer stops the loading spinner
+            return
+        route = prefixed[1:]
+    
+    handler, takes_state = route
+    if takes_state:
+        await handler(callback, state, callback_answer)
+    else:
+        await handler(callback, callback_answer)
+
+# Every command goes through dispatch_command, which looks up the target here, instead
+# of aiogram testing a separate Command filter per handler on each message.
+# Command name -> (handler, whether it takes the FSM state)
+COMMAND_HANDLERS: Dict[str, Tuple[Callable[..., Awaitable[None]], bool]] = {
+    "start": (cmd_start, False),
+    "reset": (cmd_reset, True),
+    "video": (cmd_send_video, False),
+    "generate": (cmd_generate, True),
+    "admin": (cmd_admin, False),
+    "give_credits": (cmd_give_credits, False),
+    "lookup": (cmd_lookup, False),
+    "help": (cmd_help, False),
+    "buy": (cmd_buy, False),
+}
+
+# Message handlers are registered here, once COMMAND_HANDLERS exists. aiogram tries them
+# in this order, so commands still win over a pending prompt or image step.
+dp.message.register(dispatch_command, Command(*COMMAND_HANDLERS))
+dp.message.register(process_prompt, GenerationStates.waiting_for_prompt)
+dp.message.register(process_image_or_skip, GenerationStates.waiting_for_image)
+dp.message.register(process_successful_payment, F.content_type == ContentType.SUCCESSFUL_PAYMENT)
 
 if __name__ == "__main__":
     # Run the bot and web server for deployment
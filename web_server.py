@@ -5,12 +5,17 @@ Serves the HTML interface and handles image uploads
 """
 
 import os
+import re
+import gzip
+import asyncio
+import hashlib
 import logging
 from aiohttp import web
 from aiohttp.web import Request, Response
-import aiofiles
 import uuid
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,23 +23,113 @@ logger = logging.getLogger(__name__)
 # Configuration
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_DIR_STR = str(UPLOAD_DIR)  # Request handlers build paths with os.path, not pathlib
 PORT = int(os.getenv("WEB_PORT", 8080))
 HOST = os.getenv("WEB_HOST", "0.0.0.0")
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Multipart read size, and how much is buffered per disk write
+MAX_UPLOAD_SIZE = 32 * 1024 * 1024  # 32MB, well above any photo the interface needs
+HTML_PATH = Path("web_interface.html")
+
+# Uploads are never overwritten (each gets a fresh uuid), so clients and CDNs may keep them forever
+UPLOAD_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UNSAFE_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+
+# Content-Type for uploaded images by extension
+IMAGE_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+@dataclass(frozen=True)
+class HtmlPage:
+    """The web interface as served: raw and gzipped bodies, each with its own strong ETag"""
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    gzip_etag: str
+
+# The interface only changes with a deploy, so it is read and compressed once in create_app
+html_page: Optional[HtmlPage] = None
+
+def load_html_page() -> Optional[HtmlPage]:
+    """Read and compress web_interface.html, or None if it's missing"""
+    if not HTML_PATH.is_file():
+        return None
+    body = HTML_PATH.read_bytes()
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    return HtmlPage(
+        body=body,
+        gzip_body=gzip.compress(body, 6),
+        etag=etag,
+        gzip_etag=f"{etag}-gzip"
+    )
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip; q=0 refuses it"""
+    wildcard = False
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        coding = coding.lower()
+        if coding in ('gzip', 'x-gzip'):
+            return q > 0
+        if coding == '*':
+            wildcard = q > 0
+    return wildcard
+
+def write_all(fd: int, data) -> None:
+    """Write a whole buffer to a file descriptor (run via asyncio.to_thread)"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def discard_file(fd: int, path: str) -> None:
+    """Close and delete a partially written file (run via asyncio.to_thread)"""
+    os.close(fd)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
 
 async def serve_html(request: Request) -> Response:
     """Serve the main HTML interface"""
-    html_path = Path("web_interface.html")
-    if not html_path.exists():
+    page = html_page
+    if page is None:
         return web.Response(text="web_interface.html not found", status=404)
     
-    async with aiofiles.open(html_path, 'r') as f:
-        content = await f.read()
+    headers = {'Cache-Control': 'public, max-age=300', 'Vary': 'Accept-Encoding'}
+    body, etag = page.body, page.etag
+    if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        headers['Content-Encoding'] = 'gzip'
+        body, etag = page.gzip_body, page.gzip_etag
     
-    return web.Response(text=content, content_type='text/html')
+    # Revalidation from a browser that already has this version in this encoding
+    if any(tag.value == etag for tag in request.if_none_match or ()):
+        response = web.Response(status=304, headers={'Vary': 'Accept-Encoding'})
+        response.etag = etag
+        return response
+    
+    response = web.Response(body=body, content_type='text/html', charset='utf-8', headers=headers)
+    response.etag = etag
+    return response
 
 async def upload_image(request: Request) -> Response:
     """Handle image uploads and return public URL"""
     try:
+        # Refuse declared oversize bodies before reading anything
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_SIZE:
+            return web.json_response({"error": "Image too large"}, status=413)
+        
         # Get the uploaded file
         reader = await request.multipart()
         field = await reader.next()
@@ -42,17 +137,41 @@ async def upload_image(request: Request) -> Response:
         if field.name != 'image':
             return web.json_response({"error": "No image field"}, status=400)
         
-        # Read the image
-        filename = field.filename or f"image_{uuid.uuid4().hex[:8]}"
-        filepath = UPLOAD_DIR / filename
+        # Every upload gets its own uuid-prefixed name: nothing already served (and
+        # cached as immutable) can be replaced, and the client's name can't leave UPLOAD_DIR
+        client_name = (field.filename or "image").replace('\\', '/').rsplit('/', 1)[-1]
+        safe_name = UNSAFE_FILENAME_CHARS.sub('_', client_name).lstrip('.')[-100:] or "image"
+        filename = f"{uuid.uuid4().hex}_{safe_name}"
+        filepath = os.path.join(UPLOAD_DIR_STR, filename)
         
-        # Save the file
-        async with aiofiles.open(filepath, 'wb') as f:
+        # Save the file, handing the worker thread one write per ~1MB instead of
+        # one per multipart chunk
+        # (chunked bodies declare no length, so the size is also counted as it streams in)
+        fd = await asyncio.to_thread(os.open, filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        saved = False
+        try:
+            received = 0
+            buffer = bytearray()
             while True:
-                chunk = await field.read_chunk()
+                chunk = await field.read_chunk(UPLOAD_CHUNK_SIZE)
                 if not chunk:
                     break
-                await f.write(chunk)
+                received += len(chunk)
+                if received > MAX_UPLOAD_SIZE:
+                    return web.json_response({"error": "Image too large"}, status=413)
+                buffer += chunk
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await asyncio.to_thread(write_all, fd, buffer)
+                    buffer = bytearray()
+            if buffer:
+                await asyncio.to_thread(write_all, fd, buffer)
+            saved = True
+        finally:
+            # Oversize, aborted or failed uploads leave no partial file behind
+            if saved:
+                await asyncio.to_thread(os.close, fd)
+            else:
+                await asyncio.to_thread(discard_file, fd, filepath)
         
         # Get the base URL from request
         base_url = f"{request.scheme}://{request.host}"
@@ -69,36 +188,36 @@ async def upload_image(request: Request) -> Response:
         logger.error(f"Upload error: {e}")
         return web.json_response({"error": str(e)}, status=500)
 
-async def serve_upload(request: Request) -> Response:
+async def serve_upload(request: Request) -> web.StreamResponse:
     """Serve uploaded images"""
     filename = request.match_info.get('filename')
-    if not filename:
-        return web.Response(status=404)
-    
-    filepath = UPLOAD_DIR / filename
-    if not filepath.exists() or not filepath.is_file():
+    # Only bare, non-hidden names inside UPLOAD_DIR; this also rules out "." and ".."
+    if not filename or filename.startswith('.') or '/' in filename or '\\' in filename:
         return web.Response(status=404)
     
-    async with aiofiles.open(filepath, 'rb') as f:
-        content = await f.read()
+    filepath = os.path.join(UPLOAD_DIR_STR, filename)
     
-    # Determine content type
-    content_type = 'image/jpeg'
-    if filename.endswith('.png'):
-        content_type = 'image/png'
-    elif filename.endswith('.webp'):
-        content_type = 'image/webp'
-    elif filename.endswith('.gif'):
-        content_type = 'image/gif'
+    # Determine content type; unknown extensions keep the old JPEG default
+    content_type = IMAGE_CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'image/jpeg')
     
-    return web.Response(body=content, content_type=content_type)
+    # Streamed from the page cache with sendfile rather than read into memory first;
+    # FileResponse answers 404 for a missing file and 403 for anything but a regular file
+    return web.FileResponse(filepath, headers={
+        'Content-Type': content_type,
+        'Cache-Control': UPLOAD_CACHE_CONTROL
+    })
+
+HEALTH_OK_BODY = b"OK"  # Responses can't be reused, the bytes can
 
 async def health_check(request: Request) -> Response:
     """Health check endpoint"""
-    return web.Response(text="OK")
+    return web.Response(body=HEALTH_OK_BODY, content_type="text/plain", headers={'Cache-Control': 'no-store'})
 
 def create_app():
     """Create and configure the web application"""
+    global html_page
+    html_page = load_html_page()
+    
     app = web.Application()
     
     # Routes
@@ -112,10 +231,20 @@ def create_app():
 
 def main():
     """Run the web server"""
+    # uvloop is optional (it doesn't build on Windows) and must be in place before
+    # run_app creates the loop
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("⚡ Using uvloop event loop")
+    except ImportError:
+        logger.info("uvloop not installed, using the default asyncio event loop")
+    
     app = create_app()
     logger.info(f"🌐 Starting web server on {HOST}:{PORT}")
     logger.info(f"📁 Upload directory: {UPLOAD_DIR.absolute()}")
-    web.run_app(app, host=HOST, port=PORT)
+    # No per-request access log line: uploads are logged by upload_image itself
+    web.run_app(app, host=HOST, port=PORT, access_log=None)
 
 if __name__ == "__main__":
     main()